@@ -0,0 +1,116 @@
+# Micro-benchmarks of the compiled KindEncoder against the per-value encoding
+# KindDBSvc used before it (reproduced below as the baseline).
+#
+#   python3 benchmarks/record_encoder_bench.py [rows]
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "shared", "kinddbsvc"))
+
+from record_encoder import encoder_for_kind  # noqa: E402
+
+
+def legacy_create_fieldValueObject(fType, value, modifiers):
+    isList = "LIST" in modifiers
+    fieldValueObject = None
+
+    if fType == "ID":
+        fieldValueObject = ({"l_ID": value} if isList else {"ID": value})
+    if fType == "STRING":
+        fieldValueObject = ({"l_STRING": value} if isList else {"STRING": value})
+    if fType == "INT":
+        fieldValueObject = ({"l_INT": value} if isList else {"INT": value})
+    if fType == "FLOAT":
+        fieldValueObject = ({"l_FLOAT": value} if isList else {"FLOAT": value})
+    if fType == "BOOLEAN":
+        fieldValueObject = ({"l_BOOLEAN": value} if isList else {"BOOLEAN": value})
+    if fType == "DATE":
+        fieldValueObject = ({"l_DATE": value} if isList else {"DATE": value})
+    if fType == "TIME":
+        fieldValueObject = ({"l_TIME": value} if isList else {"TIME": value})
+    if fType == "DATETIME":
+        fieldValueObject = ({"l_DATETIME": value} if isList else {"DATETIME": value})
+    if fType == "BOOLEAN":
+        fieldValueObject = ({"l_BOOLEAN": value} if isList else {"BOOLEAN": value})
+    if fType == "JSON":
+        fieldValueObject = ({"l_JSON": value} if isList else {"JSON": value})
+    if fType == "KIND":
+        fieldValueObject = ({"l_KIND": value} if isList else {"KIND": value})
+
+    return fieldValueObject
+
+
+def legacy_instanceSetFromObjects(schema, objects):
+    fieldIds = [f['id'] for f in schema if f['name'] != 'id']
+    instanceIds = []
+    records = []
+    for obj in objects:
+        record = []
+        for field in schema:
+            val = obj.get(field['name'], None)
+            if field['name'] == 'id':
+                instanceIds.append(val)
+            else:
+                record.append(legacy_create_fieldValueObject(field['type'], val, field['modifiers']))
+        records.append(record)
+    return fieldIds, instanceIds, records
+
+
+def legacy_object_to_addInstanceInput(kind, instance):
+    addInstanceInput = {"kindId": kind['id'], "id": instance["id"], "fieldIds": [], "fieldValues": []}
+    for k, v in instance.items():
+        lis = list(filter(lambda x: x["name"] == k, kind["schema"]))
+        if len(lis) > 0:
+            field = lis[0]
+        else:
+            raise IOError("Field name specified in instance input not found in kind schema.")
+        addInstanceInput["fieldIds"].append(field["id"])
+        addInstanceInput["fieldValues"].append(legacy_create_fieldValueObject(field["type"], v, field["modifiers"]))
+    return addInstanceInput
+
+
+TYPES = ["STRING", "INT", "FLOAT", "BOOLEAN", "DATE", "TIME", "DATETIME", "JSON", "KIND", "ID"]
+
+
+def make_kind(nFields):
+    schema = [{"id": "f0", "name": "id", "type": "ID", "modifiers": []}]
+    for i in range(1, nFields):
+        schema.append({"id": "f%d" % i, "name": "field%d" % i, "type": TYPES[i % len(TYPES)],
+                       "modifiers": ["LIST"] if i % 4 == 0 else []})
+    return {"id": "bench-kind", "schema": schema}
+
+
+def make_instances(kind, rows):
+    return [{f["name"]: "%s-%d" % (f["name"], r) for f in kind["schema"]} for r in range(rows)]
+
+
+def report(label, legacy, compiled, number):
+    legacy_t = min(timeit.repeat(legacy, number=number, repeat=3)) / number
+    compiled_t = min(timeit.repeat(compiled, number=number, repeat=3)) / number
+    print("{:<40} legacy {:>10.3f} ms  compiled {:>10.3f} ms  speedup {:>5.1f}x".format(
+        label, legacy_t * 1000, compiled_t * 1000, legacy_t / compiled_t))
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    for nFields in (5, 20, 50):
+        kind = make_kind(nFields)
+        instances = make_instances(kind, rows)
+        assert legacy_instanceSetFromObjects(kind["schema"], instances) == \
+            encoder_for_kind(kind).encode_instance_set(instances)
+        assert legacy_object_to_addInstanceInput(kind, instances[0]) == \
+            encoder_for_kind(kind).encode_instance(instances[0])
+
+        report("instance set, {} rows x {} fields".format(rows, nFields),
+               lambda: legacy_instanceSetFromObjects(kind["schema"], instances),
+               lambda: encoder_for_kind(kind).encode_instance_set(instances),
+               number=1)
+        report("single instance, {} fields".format(nFields),
+               lambda: legacy_object_to_addInstanceInput(kind, instances[0]),
+               lambda: encoder_for_kind(kind).encode_instance(instances[0]),
+               number=10000)
+
+
+if __name__ == "__main__":
+    main()
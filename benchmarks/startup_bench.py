@@ -0,0 +1,69 @@
+# Cold-start benchmark: starts `server.py` in a fresh interpreter and measures
+# the time until the first byte of a `{ info { id } }` response arrives, plus
+# the time to `import server` on its own.
+#
+#   python3 benchmarks/startup_bench.py [runs]
+import os
+import sys
+import time
+import socket
+import signal
+import statistics
+import subprocess
+import urllib.request
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+QUERY = "/graphql?query=%7B%20info%20%7B%20id%20%7D%20%7D"
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def time_to_first_byte(timeout=30.0):
+    port = free_port()
+    env = dict(os.environ, PORT=str(port), WORKERS="1")
+    started = time.perf_counter()
+    process = subprocess.Popen([sys.executable, "server.py"], cwd=PROJECT_ROOT, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - started < timeout:
+            if process.poll() is not None:
+                raise RuntimeError("server.py exited with code {}".format(process.returncode))
+            try:
+                with urllib.request.urlopen("http://127.0.0.1:{}{}".format(port, QUERY), timeout=1) as resp:
+                    resp.read(1)
+                    return time.perf_counter() - started
+            except OSError:
+                time.sleep(0.005)
+        raise RuntimeError("server.py did not answer within {}s".format(timeout))
+    finally:
+        process.send_signal(signal.SIGTERM)
+        try:
+            process.wait(10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def import_time():
+    out = subprocess.check_output(
+        [sys.executable, "-c", "import time; t = time.perf_counter(); import server; print(time.perf_counter() - t)"],
+        cwd=PROJECT_ROOT)
+    return float(out)
+
+
+def report(label, samples):
+    print("{:<24} min {:>8.1f} ms  median {:>8.1f} ms  max {:>8.1f} ms".format(
+        label, min(samples) * 1000, statistics.median(samples) * 1000, max(samples) * 1000))
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    report("import server", [import_time() for _ in range(runs)])
+    report("time to first byte", [time_to_first_byte() for _ in range(runs)])
+
+
+if __name__ == "__main__":
+    main()
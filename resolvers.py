@@ -1,10 +1,51 @@
-import sys
 import json
+import uuid
+import asyncio
 import schema
 import logging
+from settings import TENANT_ID, FILE_KIND_NAME
 
 logger = logging.getLogger(__name__)
-logging.basicConfig(stream=sys.stdout, level=logging.DEBUG)
+
+# The KindDB client stack is only imported when a resolver first needs it.
+_kind_db_registry = None
+
+
+def kind_db_registry():
+    global _kind_db_registry
+    if _kind_db_registry is None:
+        from shared.kinddbsvc.registry import KindDBRegistry
+        _kind_db_registry = KindDBRegistry()
+    return _kind_db_registry
+
+
+def kind_db(tenant_id=TENANT_ID):
+    return kind_db_registry().get(tenant_id)
+
+
+# The fileAdded pipeline (and its process pool) is created on the first file.
+_file_pipeline = None
+
+
+def file_pipeline():
+    global _file_pipeline
+    if _file_pipeline is None:
+        from shared.file_pipeline import FilePipeline
+        _file_pipeline = FilePipeline(lambda records: kind_db().bulkAddInstancesByKindName(FILE_KIND_NAME, records))
+    return _file_pipeline
+
+
+def close_file_pipeline():
+    if _file_pipeline is not None:
+        _file_pipeline.close()
+
+
+async def close_kind_db():
+    if _kind_db_registry is not None:
+        await _kind_db_registry.close()
+        from shared.kinddbsvc.http_pool import close_shared_pool
+        await close_shared_pool()
+
 
 # Resolvers
 
@@ -18,20 +59,31 @@ def info():
     )
 
 
+def events(context, trigger):
+    # Unknown triggers fail the subscription itself rather than its first event.
+    context['subscriptions'].check(trigger)
+    return _events(context, trigger)
+
+
+async def _events(context, trigger):
+    async for message in context['subscriptions'].events(trigger):
+        try:
+            payload = json.loads(message)
+        except ValueError:
+            payload = message.decode('utf-8', 'replace')
+        yield schema.Event(trigger=trigger, payload=payload)
+
+
 async def all_employees():
-    employee_res = await kindDB.getAllInstancesByName(kindName="Employee")
-    base = employee_res.get("allInstances")
     employees = []
-    if base is not None:
-        records = base.get("records")
-        for r in records:
-            employees.append(schema.Employee(id=r[0].get("ID"), name=r[1].get("STRING")))
+    async for page in kind_db().iterInstancePages(kindName="Employee", columnar=True):
+        employees.extend(schema.Employee(id=i, name=n) for (i, n) in zip(page.column("id"), page.column("name")))
     return employees
 
 
 async def add_employee(employee):
     new_employee = schema.Employee(id=employee.get("id", str(uuid.uuid4())), name=employee.get("name"))
-    await kindDB.addInstanceByKindName(
+    await kind_db().addInstanceByKindName(
         "Employee",
         {
             "id": new_employee.id,
@@ -42,6 +94,26 @@ async def add_employee(employee):
     return new_employee
 
 
+async def load_kind(context, kind_id):
+    kind = await context['loaders'].kind.load(kind_id)
+    return schema.Kind(id=kind['id'], name=kind.get('name'), description=kind.get('description')) \
+        if kind is not None else None
+
+
+async def load_instance(context, instance_id, kind_id=None, kind_name=None):
+    instance = await context['loaders'].instance.load((kind_id, kind_name, instance_id))
+    return schema.Instance(id=instance['id'], kind_id=instance.get('kindId'), field_ids=instance.get('fieldIds')) \
+        if instance is not None else None
+
+
+async def kinds(context, ids):
+    return await asyncio.gather(*[load_kind(context, kind_id) for kind_id in ids])
+
+
+async def instances(context, ids, kind_id=None, kind_name=None):
+    return await asyncio.gather(*[load_instance(context, instance_id, kind_id, kind_name) for instance_id in ids])
+
+
 # Handlers
 
 
@@ -56,6 +128,7 @@ async def handle(event):
 
 async def handle_file(blob):
 
-    print("Got it! " + blob['fileAdded']['url'])
+    url = blob['fileAdded']['url']
+    logger.info("Got it! " + url)
 
-    return None
+    return await file_pipeline().process(url)
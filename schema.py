@@ -14,9 +14,31 @@ class Person(graphene.ObjectType):
     id = graphene.ID(required=True)
     name = graphene.String(required=True)
 
+
+# KindDB-backed types. Their lookups go through the request's loaders, so the
+# kinds of N instances are fetched with one batched KindDB query.
+class Kind(graphene.ObjectType):
+    id = graphene.ID(required=True)
+    name = graphene.String()
+    description = graphene.String()
+
+
+class Instance(graphene.ObjectType):
+    id = graphene.ID(required=True)
+    kind_id = graphene.ID()
+    field_ids = graphene.List(graphene.ID)
+    kind = graphene.Field(Kind)
+
+    def resolve_kind(self, info):
+        return resolvers.load_kind(info.context, self.kind_id)
+
+
 class Query(graphene.ObjectType):
     info = graphene.Field(Info)
     person = graphene.Field(Person, id=graphene.Argument(graphene.ID, required=True))
+    kinds = graphene.List(Kind, ids=graphene.Argument(graphene.List(graphene.NonNull(graphene.ID)), required=True))
+    instances = graphene.List(Instance, ids=graphene.Argument(graphene.List(graphene.NonNull(graphene.ID)), required=True),
+                              kind_id=graphene.ID(), kind_name=graphene.String())
 
     def resolve_info(self, _):
         return resolvers.info()
@@ -27,6 +49,12 @@ class Query(graphene.ObjectType):
             name=people_db[id]
         )
 
+    def resolve_kinds(self, info, ids):
+        return resolvers.kinds(info.context, ids)
+
+    def resolve_instances(self, info, ids, kind_id=None, kind_name=None):
+        return resolvers.instances(info.context, ids, kind_id, kind_name)
+
 
 class AddPersonInput(graphene.InputObjectType):
     id = graphene.ID(required=True)
@@ -46,4 +74,21 @@ class AddPerson(graphene.Mutation):
 class Mutation(graphene.ObjectType):
     add_person = AddPerson.Field()
 
-schema = graphene.Schema(query=Query, mutation=Mutation)
+
+class Event(graphene.ObjectType):
+    trigger = graphene.String(required=True)
+    payload = graphene.JSONString()
+
+
+class Subscription(graphene.ObjectType):
+    event = graphene.Field(Event, trigger=graphene.Argument(graphene.String, required=True))
+
+    def resolve_event(self, info, trigger):
+        return resolvers.events(info.context, trigger)
+
+schema = graphene.Schema(query=Query, mutation=Mutation, subscription=Subscription)
+
+# Response cache hints: seconds each root query field may be cached, and the
+# root query fields each mutation makes stale.
+cache_ttls = {'info': 3600, 'person': 60}
+cache_invalidates = {'addPerson': ['person']}
@@ -1,29 +1,91 @@
-from schema import schema
+from schema import schema, cache_ttls, cache_invalidates
+import resolvers
 from aiohttp import web
+from graphql.execution.executors.asyncio import AsyncioExecutor
 import aiohttp_cors
-import json
 import logging
 import asyncio
 import sys
 import os
-from settings import LOG_LEVEL, SERVICE_PORT, SERVICE_ADDRESS, PROJECT_ROOT
+import signal
+from settings import LOG_LEVEL, SERVICE_PORT, SERVICE_ADDRESS, PROJECT_ROOT, TENANT_ID, DOCUMENT_CACHE_SIZE, \
+    RESPONSE_CACHE_ENABLED, RESPONSE_CACHE_MAX_BYTES, RESPONSE_CACHE_DEFAULT_TTL, BATCH_MAX_OPERATIONS, \
+    BATCH_CONCURRENCY, WORKERS, REUSE_PORT, USE_UVLOOP, SHUTDOWN_TIMEOUT, SERVICE_ID, RABBITMQ_ADDR, RABBITMQ_PORT, \
+    SUBSCRIPTION_QUEUE_SIZE, SUBSCRIPTION_OVERFLOW, SUBSCRIPTION_KEEP_ALIVE, SUBSCRIPTION_TRIGGERS
+from shared.kinddbsvc.dataloader import KindDBLoaders
+from shared.graphql_server.document_cache import CachedDocumentBackend
+from shared.graphql_server.subscriptions import SubscriptionHub, GraphQLWSSession
+from shared.graphql_server import offload
+from shared import json_codec
 
 logger = logging.getLogger(__name__)
-logging.basicConfig(stream=sys.stdout, level=LOG_LEVEL)
+
+
+def amqp_pubsub():
+    from shared.maana_amqp_pubsub.amqp_pubsub import AmqpPubSub
+    from shared.maana_amqp_pubsub.configuration import AmqpConnectionConfig
+    # Subscriptions consume from queues of their own, so they never take events
+    # from the service's handlers and every process sees every event.
+    return AmqpPubSub(AmqpConnectionConfig(RABBITMQ_ADDR, RABBITMQ_PORT, SERVICE_ID),
+                      queue_options={'exclusive': True})
 
 # Copy and paste to drop into debugger.
 # import code
 # code.interact(local=dict(globals(), **locals()))
 
-def init(loopy):
+def init(loopy, sock=None):
     asyncio.set_event_loop(loopy)
     app = web.Application()
+    document_backend = CachedDocumentBackend(DOCUMENT_CACHE_SIZE)
+    app['document_backend'] = document_backend
 
-    async def graphql(request):
-        back = await request.json()
-        result = await schema.execute(back.get('query', ''), variable_values=back.get('variables', ''),
-                                      operation_name=back.get('operationName', ''),
-                                      return_promise=True, allow_subscriptions=True)
+    response_cache = None
+    if RESPONSE_CACHE_ENABLED:
+        from shared.graphql_server.response_cache import ResponseCache, operation_root_fields
+        response_cache = ResponseCache(RESPONSE_CACHE_MAX_BYTES, RESPONSE_CACHE_DEFAULT_TTL,
+                                       fieldTtls=cache_ttls, invalidates=cache_invalidates)
+    app['response_cache'] = response_cache
+
+    # AMQP is only connected once the first subscription starts.
+    subscription_hub = SubscriptionHub(amqp_pubsub, SUBSCRIPTION_QUEUE_SIZE, SUBSCRIPTION_TRIGGERS)
+    app['subscription_hub'] = subscription_hub
+
+    def request_params(request, body):
+        if request.method == 'GET':
+            variables = request.query.get('variables')
+            return {
+                'query': request.query.get('query', ''),
+                'variables': json_codec.loads(variables) if variables else None,
+                'operationName': request.query.get('operationName')
+            }
+        return json_codec.loads(body)
+
+    def operation_info(params):
+        try:
+            document = document_backend.document_from_string(schema, params.get('query') or '')
+        except Exception:
+            return None, ()
+        return operation_root_fields(document.document_ast, params.get('operationName'))
+
+    def request_loaders():
+        # Loaders are per request so batching and caching never leak across requests.
+        return KindDBLoaders(lambda: resolvers.kind_db(TENANT_ID))
+
+    async def execute_result(request, params, loaders):
+        context = {
+            'request': request,
+            'loaders': loaders,
+            'subscriptions': subscription_hub
+        }
+        return await schema.execute(params.get('query', ''), variable_values=params.get('variables', ''),
+                                    operation_name=params.get('operationName', ''), context=context,
+                                    executor=AsyncioExecutor(loop=loopy), backend=document_backend,
+                                    return_promise=True, allow_subscriptions=True)
+
+    async def execute(request, params, loaders):
+        result = await execute_result(request, params, loaders)
+        if not hasattr(result, 'errors'):
+            return {'errors': ['Subscriptions are only served over the /subscriptions WebSocket']}
         data = dict()
         if result.errors:
             data['errors'] = [str(err) for err in result.errors]
@@ -31,7 +93,85 @@ def init(loopy):
             data['data'] = result.data
         if result.invalid:
             data['invalid'] = result.invalid
-        return web.Response(text=json.dumps(data), headers={'Content-Type': 'application/json'})
+        return data
+
+    async def execute_uncached(request, params, loaders):
+        if response_cache is None:
+            return await execute(request, params, loaders)
+        operation, fields = operation_info(params)
+        data = await execute(request, params, loaders)
+        if operation == 'mutation':
+            response_cache.invalidate_mutation(fields)
+        return data
+
+    async def execute_batch(request, batch):
+        # Operations of one batch share the request's loaders, so lookups made by
+        # different operations are batched together too.
+        loaders = request_loaders()
+        semaphore = asyncio.Semaphore(BATCH_CONCURRENCY) if BATCH_CONCURRENCY > 0 else None
+
+        async def run(params):
+            try:
+                if not isinstance(params, dict):
+                    raise ValueError("Batched operations must be JSON objects")
+                if semaphore is None:
+                    return await execute_uncached(request, params, loaders)
+                async with semaphore:
+                    return await execute_uncached(request, params, loaders)
+            except Exception as e:
+                logger.error("Batched operation failed: {}".format(e))
+                return {'errors': [str(e)]}
+
+        return await asyncio.gather(*[run(params) for params in batch])
+
+    def cached_response(request, entry):
+        headers = {
+            'Content-Type': 'application/json',
+            'ETag': entry.etag,
+            'Cache-Control': 'private, max-age={}'.format(response_cache.max_age(entry))
+        }
+        if entry.etag in request.headers.get('If-None-Match', ''):
+            return web.Response(status=304, headers=headers)
+        return web.Response(body=entry.body, headers=headers)
+
+    async def graphql(request):
+        params = request_params(request, await request.read())
+
+        if isinstance(params, list):
+            if BATCH_MAX_OPERATIONS and len(params) > BATCH_MAX_OPERATIONS:
+                return web.Response(status=400, body=json_codec.dumps({'errors': [
+                    "Batch of {} operations exceeds the limit of {}".format(len(params), BATCH_MAX_OPERATIONS)]}),
+                    headers={'Content-Type': 'application/json'})
+            data = await execute_batch(request, params)
+            return web.Response(body=json_codec.dumps(data), headers={'Content-Type': 'application/json'})
+
+        operation, fields = operation_info(params) if response_cache is not None else (None, ())
+        cacheable = request.method == 'GET' and operation == 'query' and fields is not None
+        if cacheable:
+            key = response_cache.key(params.get('query'), params.get('variables'), params.get('operationName'),
+                                     TENANT_ID)
+            entry = response_cache.get(key)
+            if entry is not None:
+                return cached_response(request, entry)
+
+        data = await execute(request, params, request_loaders())
+        body = json_codec.dumps(data)
+        if operation == 'mutation':
+            response_cache.invalidate_mutation(fields)
+        elif cacheable and 'errors' not in data:
+            entry = response_cache.put(key, body, fields)
+            if entry is not None:
+                return cached_response(request, entry)
+        return web.Response(body=body, headers={'Content-Type': 'application/json'})
+
+    async def subscriptions(request):
+        ws = web.WebSocketResponse(protocols=('graphql-ws',))
+        await ws.prepare(request)
+        loaders = request_loaders()
+        session = GraphQLWSSession(ws, lambda payload: execute_result(request, payload, loaders),
+                                   SUBSCRIPTION_QUEUE_SIZE, SUBSCRIPTION_OVERFLOW, SUBSCRIPTION_KEEP_ALIVE)
+        await session.run()
+        return ws
 
     async def graphiql(request):
         return web.FileResponse(os.path.join(PROJECT_ROOT, "shared") + "/graphiql/graphiql.html")
@@ -52,11 +192,17 @@ def init(loopy):
     app.router.add_post('/graphql', graphql, name='graphql')
     app.router.add_get('/graphql', graphql, name='graphql')
 
+    app.router.add_get('/subscriptions', subscriptions, name='subscriptions')
+
     app.router.add_route('*', path='/graphiql', handler=graphiql)
 
     runner = web.AppRunner(app)
     loopy.run_until_complete(runner.setup())
-    site = web.TCPSite(runner, SERVICE_ADDRESS, SERVICE_PORT)
+    if sock is not None:
+        site = web.SockSite(runner, sock, shutdown_timeout=SHUTDOWN_TIMEOUT)
+    else:
+        site = web.TCPSite(runner, SERVICE_ADDRESS, SERVICE_PORT, shutdown_timeout=SHUTDOWN_TIMEOUT,
+                           reuse_port=REUSE_PORT or None)
 
     loopy.run_until_complete(
         asyncio.gather(
@@ -71,21 +217,54 @@ def init(loopy):
         )
     )
 
+    # SIGTERM/SIGINT stop accepting connections and give in-flight requests
+    # SHUTDOWN_TIMEOUT seconds to finish.
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loopy.add_signal_handler(signum, loopy.stop)
+
     try:
-        logging.info("Started server on {}:{}".format(
-            SERVICE_ADDRESS, SERVICE_PORT))
+        logging.info("Started server on {}:{} (pid {})".format(
+            SERVICE_ADDRESS, SERVICE_PORT, os.getpid()))
         loopy.run_forever()
     except Exception as e:
         runner.shutdown()
         loopy.close()
         logger.error(e)
         sys.exit(-1)
+
+    logging.info("Draining server (pid {})".format(os.getpid()))
+    loopy.run_until_complete(runner.cleanup())
+    loopy.run_until_complete(subscription_hub.close())
+    loopy.run_until_complete(resolvers.close_kind_db())
+    resolvers.close_file_pipeline()
+    offload.shutdown()
+    loopy.close()
     return None
 
+
+def worker(index, sock=None):
+    loop = asyncio.new_event_loop()
+    init(loop, sock)
+
+
 if __name__ == "__main__":
-    loop = asyncio.get_event_loop()
-    try:
-        init(loop)
-    except KeyboardInterrupt:
-        loop.close()
-        sys.exit(1)
+    logging.basicConfig(stream=sys.stdout, level=LOG_LEVEL)
+    from shared.graphql_server import prefork
+
+    if USE_UVLOOP:
+        prefork.use_uvloop()
+
+    workers = prefork.worker_count(WORKERS)
+    if workers == 1:
+        loop = asyncio.get_event_loop()
+        try:
+            init(loop)
+        except KeyboardInterrupt:
+            loop.close()
+            sys.exit(1)
+    else:
+        # With REUSE_PORT every worker binds its own socket and the kernel
+        # balances connections; otherwise all workers accept on one socket
+        # bound here before forking.
+        sock = None if REUSE_PORT else prefork.bind_socket(SERVICE_ADDRESS, SERVICE_PORT)
+        prefork.WorkerSupervisor(worker, workers, args=(sock,), shutdownTimeout=SHUTDOWN_TIMEOUT + 5).run()
@@ -8,5 +8,59 @@ load_dotenv(verbose=True, dotenv_path=os.path.join(PROJECT_ROOT, '.env'))
 SERVICE_ID = os.getenv('SERVICE_ID')
 SERVICE_ADDRESS = '0.0.0.0'
 SERVICE_PORT = os.getenv('PORT', '7357')
+RABBITMQ_ADDR = os.getenv('RABBITMQ_ADDR', 'localhost')
+RABBITMQ_PORT = os.getenv('RABBITMQ_PORT', '5672')
 
-LOG_LEVEL = logging.DEBUG
\ No newline at end of file
+LOG_LEVEL = logging.DEBUG
+
+KINDDB_SERVICE_URL = os.getenv('KINDDB_SERVICE_URL')
+KIND_CACHE_SIZE = int(os.getenv('KIND_CACHE_SIZE', '256'))
+KIND_CACHE_TTL = float(os.getenv('KIND_CACHE_TTL', '300'))
+RECURSION_MAX_DEPTH = int(os.getenv('RECURSION_MAX_DEPTH', '8'))
+RECURSION_CONCURRENCY = int(os.getenv('RECURSION_CONCURRENCY', '4'))
+PAGE_SIZE = int(os.getenv('PAGE_SIZE', '1000'))
+MAX_BUFFERED_RECORDS = int(os.getenv('MAX_BUFFERED_RECORDS', '10000'))
+BULK_BATCH_SIZE = int(os.getenv('BULK_BATCH_SIZE', '1000'))
+BULK_MAX_BATCH_BYTES = int(os.getenv('BULK_MAX_BATCH_BYTES', str(4 * 1024 * 1024)))
+BULK_CONCURRENCY = int(os.getenv('BULK_CONCURRENCY', '4'))
+BULK_RETRIES = int(os.getenv('BULK_RETRIES', '3'))
+BULK_BACKOFF = float(os.getenv('BULK_BACKOFF', '0.5'))
+WRITE_BEHIND_WINDOW = float(os.getenv('WRITE_BEHIND_WINDOW', '0.05'))
+WRITE_BEHIND_MAX_ITEMS = int(os.getenv('WRITE_BEHIND_MAX_ITEMS', '500'))
+KINDDB_PERSISTED_QUERIES = os.getenv('KINDDB_PERSISTED_QUERIES', 'false').lower() in ('1', 'true', 'yes')
+JSON_CODEC = os.getenv('JSON_CODEC', 'auto')
+KINDDB_POOL_LIMIT = int(os.getenv('KINDDB_POOL_LIMIT', '100'))
+KINDDB_POOL_LIMIT_PER_HOST = int(os.getenv('KINDDB_POOL_LIMIT_PER_HOST', '0'))
+KINDDB_KEEPALIVE_TIMEOUT = float(os.getenv('KINDDB_KEEPALIVE_TIMEOUT', '60'))
+KINDDB_DNS_CACHE_TTL = int(os.getenv('KINDDB_DNS_CACHE_TTL', '300'))
+KINDDB_UNIX_SOCKET = os.getenv('KINDDB_UNIX_SOCKET')
+KINDDB_MAX_TENANTS = int(os.getenv('KINDDB_MAX_TENANTS', '1000'))
+KINDDB_TENANT_IDLE_TIMEOUT = float(os.getenv('KINDDB_TENANT_IDLE_TIMEOUT', '600'))
+KINDDB_TENANT_CONCURRENCY = int(os.getenv('KINDDB_TENANT_CONCURRENCY', '8'))
+TENANT_ID = os.getenv('TENANT_ID', '0')
+MULTIPLEX_WINDOW = float(os.getenv('MULTIPLEX_WINDOW', '0.002'))
+MULTIPLEX_MAX_OPERATIONS = int(os.getenv('MULTIPLEX_MAX_OPERATIONS', '50'))
+DOCUMENT_CACHE_SIZE = int(os.getenv('DOCUMENT_CACHE_SIZE', '256'))
+RESPONSE_CACHE_ENABLED = os.getenv('RESPONSE_CACHE_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv('RESPONSE_CACHE_MAX_BYTES', str(16 * 1024 * 1024)))
+RESPONSE_CACHE_DEFAULT_TTL = float(os.getenv('RESPONSE_CACHE_DEFAULT_TTL', '0'))
+BATCH_MAX_OPERATIONS = int(os.getenv('BATCH_MAX_OPERATIONS', '100'))
+BATCH_CONCURRENCY = int(os.getenv('BATCH_CONCURRENCY', '8'))
+WORKERS = int(os.getenv('WORKERS', '1'))
+REUSE_PORT = os.getenv('REUSE_PORT', 'false').lower() in ('1', 'true', 'yes')
+USE_UVLOOP = os.getenv('USE_UVLOOP', 'false').lower() in ('1', 'true', 'yes')
+SHUTDOWN_TIMEOUT = float(os.getenv('SHUTDOWN_TIMEOUT', '30'))
+SUBSCRIPTION_QUEUE_SIZE = int(os.getenv('SUBSCRIPTION_QUEUE_SIZE', '100'))
+SUBSCRIPTION_OVERFLOW = os.getenv('SUBSCRIPTION_OVERFLOW', 'drop_oldest')
+SUBSCRIPTION_KEEP_ALIVE = float(os.getenv('SUBSCRIPTION_KEEP_ALIVE', '10'))
+SUBSCRIPTION_TRIGGERS = [t.strip() for t in os.getenv('SUBSCRIPTION_TRIGGERS', '').split(',') if t.strip()]
+FILE_KIND_NAME = os.getenv('FILE_KIND_NAME', 'FileRecord')
+FILE_CHUNK_SIZE = int(os.getenv('FILE_CHUNK_SIZE', str(1024 * 1024)))
+FILE_BLOCK_BYTES = int(os.getenv('FILE_BLOCK_BYTES', str(4 * 1024 * 1024)))
+FILE_MAX_BLOCK_BYTES = int(os.getenv('FILE_MAX_BLOCK_BYTES', str(16 * 1024 * 1024)))
+FILE_CONCURRENCY = int(os.getenv('FILE_CONCURRENCY', '2'))
+FILE_PARSE_WORKERS = int(os.getenv('FILE_PARSE_WORKERS', '0'))
+FILE_MAX_PENDING_BLOCKS = int(os.getenv('FILE_MAX_PENDING_BLOCKS', '4'))
+FILE_LOCAL_ROOT = os.getenv('FILE_LOCAL_ROOT', '')
+OFFLOAD_THREAD_WORKERS = int(os.getenv('OFFLOAD_THREAD_WORKERS', '0'))
+OFFLOAD_PROCESS_WORKERS = int(os.getenv('OFFLOAD_PROCESS_WORKERS', '0'))
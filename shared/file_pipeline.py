@@ -0,0 +1,203 @@
+import os
+import json
+import time
+import asyncio
+import logging
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import urlparse
+from urllib.request import url2pathname
+from settings import FILE_CHUNK_SIZE, FILE_BLOCK_BYTES, FILE_MAX_BLOCK_BYTES, FILE_CONCURRENCY, FILE_PARSE_WORKERS, \
+    FILE_MAX_PENDING_BLOCKS, FILE_LOCAL_ROOT
+
+logger = logging.getLogger(__name__)
+
+
+# Parsers run in worker processes, so they must be module-level functions.
+# They get a block of complete lines, the number of its first line and the
+# source URL, and return a list of instance dicts.
+def parse_lines(block, firstLine, source):
+    records = []
+    for offset, line in enumerate(block.decode("utf-8", "replace").splitlines()):
+        line = line.strip()
+        if not line:
+            continue
+        record = None
+        if line[0] == "{":
+            try:
+                record = json.loads(line)
+            except ValueError:
+                pass
+        if not isinstance(record, dict):
+            record = {"text": line}
+        record.setdefault("id", "{}:{}".format(source, firstLine + offset))
+        records.append(record)
+    return records
+
+
+async def read_file(path, chunkSize):
+    loop = asyncio.get_event_loop()
+    with open(path, "rb") as f:
+        while True:
+            chunk = await loop.run_in_executor(None, f.read, chunkSize)
+            if not chunk:
+                return
+            yield chunk
+
+
+async def read_http(url, chunkSize):
+    import aiohttp
+    async with aiohttp.ClientSession() as session:
+        async with session.get(url) as resp:
+            resp.raise_for_status()
+            async for chunk in resp.content.iter_chunked(chunkSize):
+                yield chunk
+
+
+def local_path(path, localRoot):
+    # Local files can only be read below localRoot, and not at all without one.
+    if not localRoot:
+        raise ValueError("Local files are not enabled")
+    root = os.path.realpath(localRoot)
+    path = os.path.realpath(os.path.join(root, path))
+    if os.path.commonpath([root, path]) != root:
+        raise ValueError("{} is outside of {}".format(path, root))
+    return path
+
+
+# URLs come from events, so only http(s) is read unless localRoot allows
+# file:// URLs and paths inside it.
+def open_stream(url, chunkSize=FILE_CHUNK_SIZE, localRoot=FILE_LOCAL_ROOT):
+    parsed = urlparse(url)
+    if parsed.scheme in ("http", "https"):
+        return read_http(url, chunkSize)
+    if parsed.scheme == "file":
+        return read_file(local_path(url2pathname(parsed.path), localRoot), chunkSize)
+    if parsed.scheme == "":
+        return read_file(local_path(url, localRoot), chunkSize)
+    raise ValueError("Unsupported file URL {}".format(url))
+
+
+# Regroups a stream of chunks into blocks of whole lines of about blockBytes.
+# Records are never split: a line longer than maxBlockBytes is skipped (and
+# logged) and stands in the block as an empty line, so line numbers still match.
+async def line_blocks(chunks, blockBytes=FILE_BLOCK_BYTES, maxBlockBytes=FILE_MAX_BLOCK_BYTES):
+    buffer = bytearray()
+    skipping = False
+    async for chunk in chunks:
+        if skipping:
+            end = chunk.find(b"\n")
+            if end < 0:
+                continue
+            skipping = False
+            chunk = chunk[end:]
+        buffer.extend(chunk)
+        while len(buffer) >= blockBytes:
+            end = buffer.rfind(b"\n")
+            if end >= 0:
+                yield bytes(buffer[:end + 1])
+                del buffer[:end + 1]
+                continue
+            if len(buffer) >= maxBlockBytes:
+                logger.error("Skipping a line longer than {} bytes".format(maxBlockBytes))
+                del buffer[:]
+                skipping = True
+            break
+    if len(buffer) > 0:
+        yield bytes(buffer)
+
+
+class FileResult:
+
+    def __init__(self, url):
+        self.url = url
+        self.bytes = 0
+        self.blocks = 0
+        self.records = 0
+        self.written = 0
+        self.elapsed = 0.0
+
+    @property
+    def ok(self):
+        return self.written == self.records
+
+
+class FileWriteError(Exception):
+
+    def __init__(self, result):
+        super().__init__("{} of {} records of {} were not written".format(
+            result.records - result.written, result.records, result.url))
+        self.result = result
+
+
+# Streams files from their URL, parses blocks of lines in a process pool and
+# hands each block's records to `sink` (e.g. a KindDB bulk write) in file order.
+# Memory per file is bounded by the current chunk plus maxPendingBlocks blocks
+# being parsed or written; at most `concurrency` files are processed at once.
+class FilePipeline:
+
+    def __init__(self, sink, parser=parse_lines, concurrency=FILE_CONCURRENCY, parseWorkers=FILE_PARSE_WORKERS,
+                 chunkSize=FILE_CHUNK_SIZE, blockBytes=FILE_BLOCK_BYTES, maxBlockBytes=FILE_MAX_BLOCK_BYTES,
+                 maxPendingBlocks=FILE_MAX_PENDING_BLOCKS, localRoot=FILE_LOCAL_ROOT, executor=None):
+        self.sink = sink
+        self.parser = parser
+        self.concurrency = concurrency
+        self.parseWorkers = parseWorkers
+        self.chunkSize = chunkSize
+        self.blockBytes = blockBytes
+        self.maxBlockBytes = maxBlockBytes
+        self.maxPendingBlocks = maxPendingBlocks
+        self.localRoot = localRoot
+        self.executor = executor
+        self.semaphore = None
+
+    def _executor(self):
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(self.parseWorkers or None)
+        return self.executor
+
+    async def _write(self, result, parsed):
+        records = await parsed
+        result.records += len(records)
+        if len(records) == 0:
+            return
+        written = await self.sink(records)
+        result.written += getattr(written, "written", len(records))
+
+    async def _process(self, url):
+        loop = asyncio.get_event_loop()
+        executor = self._executor()
+        result = FileResult(url)
+        started = time.monotonic()
+        pending = deque()
+        line = 1
+        async for block in line_blocks(open_stream(url, self.chunkSize, self.localRoot), self.blockBytes,
+                                       self.maxBlockBytes):
+            result.bytes += len(block)
+            result.blocks += 1
+            pending.append(loop.run_in_executor(executor, self.parser, block, line, url))
+            line += block.count(b"\n")
+            if len(pending) >= self.maxPendingBlocks:
+                await self._write(result, pending.popleft())
+        while len(pending) > 0:
+            await self._write(result, pending.popleft())
+        result.elapsed = time.monotonic() - started
+        return result
+
+    async def process(self, url):
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.concurrency)
+        async with self.semaphore:
+            result = await self._process(url)
+        logger.info("Processed {}: {} bytes, {} records, {} written in {:.2f}s".format(
+            url, result.bytes, result.records, result.written, result.elapsed))
+        # Raising fails the event, so it is retried rather than acknowledged
+        # with records missing (their ids are stable, so rewriting is safe).
+        if not result.ok:
+            raise FileWriteError(result)
+        return result
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+            self.executor = None
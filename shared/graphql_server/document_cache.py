@@ -0,0 +1,78 @@
+import hashlib
+import logging
+from functools import partial
+from collections import OrderedDict
+from graphql import parse, validate
+from graphql.backend.base import GraphQLBackend, GraphQLDocument
+from graphql.backend.core import GraphQLCoreBackend
+from graphql.execution import execute, ExecutionResult
+
+logger = logging.getLogger(__name__)
+
+
+def _execute_validated(schema, document_ast, validation_errors, *args, **kwargs):
+    if validation_errors:
+        return ExecutionResult(errors=validation_errors, invalid=True)
+    return execute(schema, document_ast, *args, **kwargs)
+
+
+# graphql-core backend that keeps the parsed and validated AST of the most
+# recently used query strings, so repeated operations skip lexing, parsing
+# and validation. The cache empties itself when a different schema is used.
+class CachedDocumentBackend(GraphQLBackend):
+
+    def __init__(self, maxSize=256):
+        self.maxSize = maxSize
+        self.documents = OrderedDict()
+        self.schema = None
+        self.fallback = GraphQLCoreBackend()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def clear(self):
+        self.documents.clear()
+
+    def document_from_string(self, schema, document_string):
+        if not isinstance(document_string, str) or self.maxSize <= 0:
+            return self.fallback.document_from_string(schema, document_string)
+
+        if schema is not self.schema:
+            if self.schema is not None:
+                logger.info("Schema changed, clearing document cache")
+            self.clear()
+            self.schema = schema
+
+        key = hashlib.sha256(document_string.encode("utf-8")).digest()
+        document = self.documents.get(key)
+        if document is not None:
+            self.hits += 1
+            self.documents.move_to_end(key)
+            return document
+
+        self.misses += 1
+        document_ast = parse(document_string)
+        validation_errors = validate(schema, document_ast)
+        document = GraphQLDocument(
+            schema=schema,
+            document_string=document_string,
+            document_ast=document_ast,
+            execute=partial(_execute_validated, schema, document_ast, validation_errors)
+        )
+        self.documents[key] = document
+        while len(self.documents) > self.maxSize:
+            self.documents.popitem(last=False)
+            self.evictions += 1
+        return document
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.documents),
+            "maxSize": self.maxSize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRate": self.hits / lookups if lookups > 0 else 0.0,
+            "evictions": self.evictions
+        }
@@ -0,0 +1,146 @@
+import os
+import time
+import asyncio
+import logging
+import importlib
+import functools
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from settings import OFFLOAD_THREAD_WORKERS, OFFLOAD_PROCESS_WORKERS
+
+logger = logging.getLogger(__name__)
+
+THREAD = "thread"
+PROCESS = "process"
+
+# "<module>:<qualname>" -> undecorated resolver, so worker processes can find
+# the resolver by name (the decorated module attribute is the wrapper).
+_registry = {}
+
+
+def _call(fn, root, info, args):
+    started = time.time()
+    clock = time.perf_counter()
+    result = fn(root, info, **args)
+    return started, time.perf_counter() - clock, result
+
+
+def _call_registered(name, args):
+    fn = _registry.get(name)
+    if fn is None:
+        importlib.import_module(name.partition(":")[0])
+        fn = _registry[name]
+    return _call(fn, None, None, args)
+
+
+# A lazily created executor with queue and latency counters. Wait time runs
+# from submission until a worker starts the call, run time is the call itself.
+class OffloadPool:
+
+    def __init__(self, kind, maxWorkers=0):
+        self.kind = kind
+        if kind == PROCESS:
+            self.maxWorkers = maxWorkers or os.cpu_count() or 1
+        else:
+            self.maxWorkers = maxWorkers or None
+        self.executor = None
+
+        self.submitted = 0
+        self.completed = 0
+        self.errors = 0
+        self.totalWait = 0.0
+        self.maxWait = 0.0
+        self.totalRun = 0.0
+        self.maxRun = 0.0
+
+    def _executor(self):
+        if self.executor is None:
+            if self.kind == PROCESS:
+                self.executor = ProcessPoolExecutor(self.maxWorkers)
+            else:
+                self.executor = ThreadPoolExecutor(self.maxWorkers)
+        return self.executor
+
+    def _done(self, submitted, future):
+        self.completed += 1
+        if future.cancelled() or future.exception() is not None:
+            self.errors += 1
+            return
+        started, elapsed, _ = future.result()
+        wait = max(0.0, started - submitted)
+        self.totalWait += wait
+        self.maxWait = max(self.maxWait, wait)
+        self.totalRun += elapsed
+        self.maxRun = max(self.maxRun, elapsed)
+
+    async def _result(self, future):
+        return (await future)[2]
+
+    def submit(self, fn, *args):
+        loop = asyncio.get_event_loop()
+        self.submitted += 1
+        future = loop.run_in_executor(self._executor(), fn, *args)
+        future.add_done_callback(functools.partial(self._done, time.time()))
+        return asyncio.ensure_future(self._result(future))
+
+    def stats(self):
+        pending = self.submitted - self.completed
+        succeeded = self.completed - self.errors
+        workers = self.maxWorkers or (self.executor._max_workers if self.executor is not None else 0)
+        return {
+            "kind": self.kind,
+            "workers": workers,
+            "pending": pending,
+            "queueDepth": max(0, pending - workers),
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "errors": self.errors,
+            "meanWait": self.totalWait / succeeded if succeeded > 0 else 0.0,
+            "maxWait": self.maxWait,
+            "meanRun": self.totalRun / succeeded if succeeded > 0 else 0.0,
+            "maxRun": self.maxRun
+        }
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+            self.executor = None
+
+
+pools = {
+    THREAD: OffloadPool(THREAD, OFFLOAD_THREAD_WORKERS),
+    PROCESS: OffloadPool(PROCESS, OFFLOAD_PROCESS_WORKERS)
+}
+
+
+# Runs a blocking or CPU-bound resolver in the thread or process pool and
+# returns an asyncio future, which AsyncioExecutor awaits like an async
+# resolver. Thread-pool resolvers get root and info as usual. Process-pool
+# resolvers are called with root and info set to None (neither can be
+# pickled), so they may only depend on their GraphQL arguments, which must be
+# picklable, as must their result.
+def offload(kind=THREAD):
+    if kind not in pools:
+        raise ValueError("Unknown offload pool {}".format(kind))
+
+    def decorator(fn):
+        name = "{}:{}".format(fn.__module__, fn.__qualname__)
+        _registry[name] = fn
+
+        @functools.wraps(fn)
+        def wrapper(root, info, **args):
+            if kind == PROCESS:
+                return pools[kind].submit(_call_registered, name, args)
+            return pools[kind].submit(_call, fn, root, info, args)
+
+        return wrapper
+
+    return decorator
+
+
+def stats():
+    return {kind: pool.stats() for kind, pool in pools.items()}
+
+
+def shutdown():
+    for pool in pools.values():
+        pool.shutdown()
@@ -0,0 +1,138 @@
+import os
+import time
+import signal
+import socket
+import asyncio
+import logging
+import multiprocessing
+from multiprocessing.connection import wait
+
+logger = logging.getLogger(__name__)
+
+
+def worker_count(workers):
+    # 0 means one worker per CPU this process may run on.
+    if workers > 0:
+        return workers
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def use_uvloop():
+    try:
+        import uvloop
+    except ImportError:
+        logger.warning("USE_UVLOOP is set but uvloop is not installed, using the default asyncio loop")
+        return False
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    return True
+
+
+def bind_socket(address, port, reuse_port=False, backlog=128):
+    sock = socket.socket(socket.AF_INET6 if ':' in address else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((address, int(port)))
+    sock.listen(backlog)
+    sock.setblocking(False)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _run_worker(target, index, *args):
+    # A forked worker inherits the supervisor's SIGTERM/SIGINT handlers, which
+    # would swallow a stop signal arriving before the worker installs its own.
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    target(index, *args)
+
+
+# Runs `target(index, *args)` in `workers` forked processes and keeps them
+# running: a worker that exits while the supervisor is not stopping is started
+# again, after a backoff that doubles while workers keep dying right after start.
+# SIGTERM/SIGINT stop the supervisor; workers get SIGTERM, `shutdownTimeout`
+# seconds to drain, and are killed after that.
+class WorkerSupervisor:
+
+    def __init__(self, target, workers, args=(), shutdownTimeout=30.0, restartBackoff=0.5,
+                 maxRestartBackoff=30.0, minUptime=5.0):
+        self.target = target
+        self.workers = workers
+        self.args = args
+        self.shutdownTimeout = shutdownTimeout
+        self.restartBackoff = restartBackoff
+        self.maxRestartBackoff = maxRestartBackoff
+        self.minUptime = minUptime
+
+        self.context = multiprocessing.get_context('fork')
+        self.processes = {}
+        self.started = {}
+        self.backoff = {}
+        self.restartAt = {}
+        self.stopping = False
+
+        self.restarts = 0
+
+    def _spawn(self, index):
+        process = self.context.Process(target=_run_worker, args=(self.target, index) + tuple(self.args),
+                                       name="worker-{}".format(index))
+        process.start()
+        self.processes[index] = process
+        self.started[index] = time.monotonic()
+        logger.info("Started worker {} (pid {})".format(index, process.pid))
+
+    def _stop(self, signum, frame):
+        self.stopping = True
+
+    def _check(self):
+        now = time.monotonic()
+        for index, process in list(self.processes.items()):
+            if process.is_alive():
+                continue
+
+            if index not in self.restartAt:
+                uptime = now - self.started[index]
+                if uptime < self.minUptime:
+                    self.backoff[index] = min(self.backoff.get(index, self.restartBackoff / 2) * 2,
+                                              self.maxRestartBackoff)
+                else:
+                    self.backoff[index] = self.restartBackoff
+                self.restartAt[index] = now + self.backoff[index]
+                logger.error("Worker {} (pid {}) exited with code {}, restarting in {:.1f}s".format(
+                    index, process.pid, process.exitcode, self.backoff[index]))
+            elif now >= self.restartAt[index]:
+                del self.restartAt[index]
+                self.restarts += 1
+                self._spawn(index)
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+
+        for index in range(self.workers):
+            self._spawn(index)
+
+        while not self.stopping:
+            wait([p.sentinel for p in self.processes.values() if p.is_alive()], timeout=0.5)
+            if not self.stopping:
+                self._check()
+
+        self.shutdown()
+
+    def shutdown(self):
+        alive = [p for p in self.processes.values() if p.is_alive()]
+        logger.info("Stopping {} workers".format(len(alive)))
+        for process in alive:
+            process.terminate()
+
+        deadline = time.monotonic() + self.shutdownTimeout
+        for process in alive:
+            process.join(max(0.0, deadline - time.monotonic()))
+
+        for process in alive:
+            if process.is_alive():
+                logger.warning("Worker {} did not drain in {}s, killing it".format(process.pid, self.shutdownTimeout))
+                os.kill(process.pid, signal.SIGKILL)
+                process.join()
@@ -0,0 +1,154 @@
+import time
+import hashlib
+import logging
+from collections import OrderedDict
+from graphql.language import ast
+from shared import json_codec
+
+logger = logging.getLogger(__name__)
+
+
+def _selection_fields(selection_set, fragments, seen):
+    fields = []
+    for selection in selection_set.selections:
+        if isinstance(selection, ast.Field):
+            fields.append(selection.name.value)
+            continue
+        if isinstance(selection, ast.FragmentSpread):
+            name = selection.name.value
+            if name in seen:
+                continue
+            fragment = fragments.get(name)
+            if fragment is None:
+                return None
+            inner = _selection_fields(fragment.selection_set, fragments, seen | {name})
+        elif isinstance(selection, ast.InlineFragment):
+            inner = _selection_fields(selection.selection_set, fragments, seen)
+        else:
+            return None
+        if inner is None:
+            return None
+        fields.extend(inner)
+    return fields
+
+
+def operation_root_fields(document_ast, operation_name=None):
+    # Returns (operation type, root field names) of the operation that would run,
+    # including the fields of fragments spread at the root. The field names are
+    # None when they cannot be determined, so the response must not be cached.
+    definitions = document_ast.definitions
+    operations = [d for d in definitions if isinstance(d, ast.OperationDefinition)]
+    if operation_name:
+        operations = [o for o in operations if o.name is not None and o.name.value == operation_name]
+    if len(operations) != 1:
+        return None, ()
+    operation = operations[0]
+    fragments = {d.name.value: d for d in definitions if isinstance(d, ast.FragmentDefinition)}
+    fields = _selection_fields(operation.selection_set, fragments, frozenset())
+    return operation.operation, tuple(fields) if fields is not None else None
+
+
+class CacheEntry:
+    __slots__ = ("body", "etag", "fields", "expires")
+
+    def __init__(self, body, etag, fields, expires):
+        self.body = body
+        self.etag = etag
+        self.fields = fields
+        self.expires = expires
+
+
+# LRU cache of serialized query responses bounded by total body size. The TTL
+# of an entry is the smallest TTL hint among its root fields, and responses
+# with a field without a hint are only cached when defaultTtl is positive;
+# mutations drop the entries whose root fields they are declared to affect, or
+# everything when a mutation has no declaration.
+class ResponseCache:
+
+    def __init__(self, maxBytes=16 * 1024 * 1024, defaultTtl=0, fieldTtls=None, invalidates=None,
+                 clock=time.monotonic):
+        self.maxBytes = maxBytes
+        self.defaultTtl = defaultTtl
+        self.fieldTtls = fieldTtls or {}
+        self.invalidates = invalidates or {}
+        self.clock = clock
+
+        self.entries = OrderedDict()
+        self.size = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def key(self, query, variables, operation_name, tenant=None):
+        normalized = " ".join((query or "").split())
+        variables = json_codec.dumps({k: variables[k] for k in sorted(variables)}) if variables else b"{}"
+        return hashlib.sha256(str(tenant or "").encode("utf-8") + b"\0" + normalized.encode("utf-8") + b"\0" +
+                              variables + b"\0" + (operation_name or "").encode("utf-8")).hexdigest()
+
+    def ttl_for(self, fields):
+        return min([self.fieldTtls.get(f, self.defaultTtl) for f in fields] or [self.defaultTtl])
+
+    def _drop(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= len(entry.body)
+        return entry
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None or entry.expires <= self.clock():
+            if entry is not None:
+                self._drop(key)
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, key, body, fields):
+        if not fields:
+            return None
+        ttl = self.ttl_for(fields)
+        if ttl <= 0 or len(body) > self.maxBytes:
+            return None
+
+        self._drop(key)
+        entry = CacheEntry(body, '"{}"'.format(hashlib.sha1(body).hexdigest()), frozenset(fields), self.clock() + ttl)
+        self.entries[key] = entry
+        self.size += len(body)
+        while self.size > self.maxBytes:
+            self._drop(next(iter(self.entries)))
+            self.evictions += 1
+        return entry
+
+    def max_age(self, entry):
+        return max(0, int(entry.expires - self.clock()))
+
+    def invalidate_mutation(self, mutation_fields):
+        affected = set()
+        for field in mutation_fields if mutation_fields is not None else [None]:
+            if field not in self.invalidates:
+                self.invalidations += len(self.entries)
+                self.entries.clear()
+                self.size = 0
+                return
+            affected.update(self.invalidates[field])
+
+        for key in [k for (k, e) in self.entries.items() if not e.fields.isdisjoint(affected)]:
+            self._drop(key)
+            self.invalidations += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "bytes": self.size,
+            "maxBytes": self.maxBytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRate": self.hits / lookups if lookups > 0 else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations
+        }
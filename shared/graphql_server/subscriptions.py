@@ -0,0 +1,256 @@
+import asyncio
+import logging
+from aiohttp import WSMsgType, WSCloseCode
+from graphql.error import GraphQLError
+from shared import json_codec
+
+logger = logging.getLogger(__name__)
+
+# What a full queue does with a new item: drop the oldest queued item, drop the
+# new item, or give up on the consumer (the session closes its socket).
+DROP_OLDEST = "drop_oldest"
+DROP_NEWEST = "drop_newest"
+DISCONNECT = "disconnect"
+OVERFLOW_POLICIES = (DROP_OLDEST, DROP_NEWEST, DISCONNECT)
+
+# graphql-ws (subscriptions-transport-ws) message types.
+GQL_CONNECTION_INIT = "connection_init"
+GQL_CONNECTION_ACK = "connection_ack"
+GQL_CONNECTION_ERROR = "connection_error"
+GQL_CONNECTION_KEEP_ALIVE = "ka"
+GQL_CONNECTION_TERMINATE = "connection_terminate"
+GQL_START = "start"
+GQL_DATA = "data"
+GQL_ERROR = "error"
+GQL_COMPLETE = "complete"
+GQL_STOP = "stop"
+
+
+# asyncio.Queue that never blocks the producer: put() applies the overflow
+# policy when the queue is full and returns whether the item was queued.
+class BoundedQueue:
+
+    def __init__(self, maxSize, overflow=DROP_OLDEST):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError("Unknown overflow policy {}".format(overflow))
+        self.queue = asyncio.Queue(maxSize)
+        self.overflow = overflow
+        self.overflowed = False
+        self.dropped = 0
+
+    def put(self, item):
+        if self.overflowed:
+            self.dropped += 1
+            return False
+        try:
+            self.queue.put_nowait(item)
+            return True
+        except asyncio.QueueFull:
+            pass
+
+        self.dropped += 1
+        if self.overflow == DISCONNECT:
+            self.overflowed = True
+        elif self.overflow == DROP_OLDEST:
+            self.queue.get_nowait()
+            self.queue.put_nowait(item)
+        return False
+
+    async def get(self):
+        return await self.queue.get()
+
+    def __len__(self):
+        return self.queue.qsize()
+
+
+# Fans AMQP events out to subscription resolvers: the first listener of a
+# trigger starts the single AmqpPubSub consumer for it, every message is copied
+# into the bounded queue of each listener, and the last listener to leave stops
+# the consumer. The pubsub is created on first use, and should consume from a
+# queue of its own (see QueueConfig's `exclusive`) so that every process sees
+# every event. Only the given `triggers` may be subscribed to, since every
+# trigger declares an exchange and queues on the broker.
+class SubscriptionHub:
+
+    def __init__(self, pubsubFactory, queueSize=100, triggers=None):
+        self.pubsubFactory = pubsubFactory
+        self.queueSize = queueSize
+        self.triggers = frozenset(triggers or ())
+        self.pubsub = None
+        self.listeners = {}
+        self.consumers = {}
+
+        self.delivered = 0
+        self.dropped = 0
+
+    async def _dispatch(self, trigger, message):
+        for queue in list(self.listeners.get(trigger, ())):
+            if queue.put(message):
+                self.delivered += 1
+            else:
+                self.dropped += 1
+
+    async def _ensure_consumer(self, trigger):
+        future = self.consumers.get(trigger)
+        if future is None:
+            if self.pubsub is None:
+                self.pubsub = self.pubsubFactory()
+            future = asyncio.ensure_future(
+                self.pubsub.subscribe(trigger, lambda message: self._dispatch(trigger, message)))
+            self.consumers[trigger] = future
+        try:
+            await asyncio.shield(future)
+        except Exception:
+            if self.consumers.get(trigger) is future:
+                del self.consumers[trigger]
+            raise
+
+    async def _release_consumer(self, trigger):
+        future = self.consumers.pop(trigger, None)
+        if future is None:
+            return
+        try:
+            await self.pubsub.unsubscribe(await future)
+        except Exception as e:
+            logger.warning("Problem stopping consumer for {}: {}".format(trigger, e))
+
+    def check(self, trigger):
+        if trigger not in self.triggers:
+            raise GraphQLError("Unknown trigger {}".format(trigger))
+
+    async def events(self, trigger):
+        self.check(trigger)
+        queue = BoundedQueue(self.queueSize, DROP_OLDEST)
+        self.listeners.setdefault(trigger, set()).add(queue)
+        try:
+            await self._ensure_consumer(trigger)
+            while True:
+                yield await queue.get()
+        finally:
+            listeners = self.listeners.get(trigger)
+            if listeners is not None:
+                listeners.discard(queue)
+                if len(listeners) == 0:
+                    del self.listeners[trigger]
+                    await self._release_consumer(trigger)
+
+    async def close(self):
+        if self.pubsub is not None:
+            await self.pubsub.close()
+
+    def stats(self):
+        return {
+            "triggers": len(self.consumers),
+            "listeners": sum(len(listeners) for listeners in self.listeners.values()),
+            "delivered": self.delivered,
+            "dropped": self.dropped
+        }
+
+
+# One graphql-ws WebSocket connection. `execute(payload)` runs an operation and
+# returns an ExecutionResult, or an Observable of them for subscriptions.
+# Everything sent to the client goes through a bounded outbound queue drained
+# by a single writer task, so a slow client costs at most `queueSize` messages.
+class GraphQLWSSession:
+
+    def __init__(self, ws, execute, queueSize=100, overflow=DROP_OLDEST, keepAlive=10.0):
+        self.ws = ws
+        self.execute = execute
+        self.outbound = BoundedQueue(queueSize, overflow)
+        self.keepAlive = keepAlive
+        self.operations = {}
+        self.tasks = []
+        self.closing = None
+
+    def send(self, message):
+        if self.outbound.put(message) or not self.outbound.overflowed:
+            return
+        if self.closing is None and not self.ws.closed:
+            logger.warning("Closing subscription socket: client is not keeping up")
+            self.closing = asyncio.ensure_future(
+                self.ws.close(code=WSCloseCode.POLICY_VIOLATION, message=b"Slow consumer"))
+
+    def send_result(self, opId, result):
+        payload = {"data": result.data}
+        if result.errors:
+            payload["errors"] = [{"message": str(err)} for err in result.errors]
+        self.send({"id": opId, "type": GQL_DATA, "payload": payload})
+
+    async def _write(self):
+        while True:
+            message = await self.outbound.get()
+            await self.ws.send_str(json_codec.dumps(message).decode("utf-8"))
+
+    async def _keep_alive(self):
+        while True:
+            await asyncio.sleep(self.keepAlive)
+            self.send({"type": GQL_CONNECTION_KEEP_ALIVE})
+
+    async def start(self, opId, payload):
+        self.stop(opId)
+        try:
+            result = await self.execute(payload)
+        except Exception as e:
+            self.send({"id": opId, "type": GQL_ERROR, "payload": {"message": str(e)}})
+            return
+
+        if not hasattr(result, "subscribe"):
+            # Queries and mutations are answered once.
+            self.send_result(opId, result)
+            self.send({"id": opId, "type": GQL_COMPLETE})
+            return
+
+        def on_error(error):
+            self.operations.pop(opId, None)
+            self.send({"id": opId, "type": GQL_ERROR, "payload": {"message": str(error)}})
+
+        def on_completed():
+            self.operations.pop(opId, None)
+            self.send({"id": opId, "type": GQL_COMPLETE})
+
+        self.operations[opId] = result.subscribe(
+            on_next=lambda r: self.send_result(opId, r), on_error=on_error, on_completed=on_completed)
+
+    def stop(self, opId):
+        disposable = self.operations.pop(opId, None)
+        if disposable is not None:
+            disposable.dispose()
+
+    async def on_message(self, data):
+        try:
+            message = json_codec.loads(data)
+            kind = message.get("type")
+        except (ValueError, AttributeError):
+            self.send({"type": GQL_CONNECTION_ERROR, "payload": {"message": "Invalid message"}})
+            return
+
+        opId = message.get("id")
+        if kind == GQL_CONNECTION_INIT:
+            self.send({"type": GQL_CONNECTION_ACK})
+            if self.keepAlive:
+                self.send({"type": GQL_CONNECTION_KEEP_ALIVE})
+                self.tasks.append(asyncio.ensure_future(self._keep_alive()))
+        elif kind == GQL_START:
+            await self.start(opId, message.get("payload") or {})
+        elif kind == GQL_STOP:
+            self.stop(opId)
+        elif kind == GQL_CONNECTION_TERMINATE:
+            await self.ws.close()
+        else:
+            self.send({"id": opId, "type": GQL_ERROR, "payload": {"message": "Unknown message type {}".format(kind)}})
+
+    async def run(self):
+        self.tasks.append(asyncio.ensure_future(self._write()))
+        try:
+            async for msg in self.ws:
+                if msg.type == WSMsgType.TEXT:
+                    await self.on_message(msg.data)
+                elif msg.type == WSMsgType.ERROR:
+                    break
+        finally:
+            for opId in list(self.operations):
+                self.stop(opId)
+            for task in self.tasks:
+                task.cancel()
+            if self.closing is not None:
+                await self.closing
@@ -0,0 +1,43 @@
+import json
+import logging
+from settings import JSON_CODEC
+
+logger = logging.getLogger(__name__)
+
+
+# A single bytes-in / bytes-out JSON codec shared by the /graphql handler and
+# KindDBSvc. orjson and ujson are used when installed; the stdlib module is the
+# fallback. JSON_CODEC=orjson|ujson|json forces a specific implementation.
+
+def _orjson():
+    import orjson
+    return "orjson", orjson.loads, orjson.dumps
+
+
+def _ujson():
+    import ujson
+    return "ujson", ujson.loads, lambda obj: ujson.dumps(obj, ensure_ascii=False).encode("utf-8")
+
+
+def _stdlib():
+    return "json", json.loads, lambda obj: json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+_CODECS = {
+    "orjson": _orjson,
+    "ujson": _ujson,
+    "json": _stdlib
+}
+
+
+def _select(preference):
+    candidates = [preference] if preference in _CODECS else ["orjson", "ujson", "json"]
+    for candidate in candidates:
+        try:
+            return _CODECS[candidate]()
+        except ImportError:
+            logger.warning("JSON codec {} is not installed".format(candidate))
+    return _stdlib()
+
+
+name, loads, dumps = _select(JSON_CODEC)
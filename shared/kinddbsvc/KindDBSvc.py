@@ -1,210 +1,38 @@
-import sys
-import json
-import string
 import logging
 import asyncio
-import aiohttp
-from settings import KINDDB_SERVICE_URL, LOG_LEVEL
-
-kindDetailsFragment = """
-id
-name
-description
-serviceId
-thumbnailUrl
-nameField
-isPublic
-schema {
-  id
-  name
-  description
-  type
-  typeKindId
-  modifiers
-  kind {
-    id
-    name
-  }
-  hide
-  autoFocus
-  displayAs
-  readonly
-}
-"""
-
-InstanceDetailsFragment = """
-    id
-    kindId
-    kind {
-      schema {
-        id
-        name
-        type
-        modifiers
-        typeKindId
-      }
-    }
-    fieldIds
-    fieldValues {
-      ID
-      STRING
-      INT
-      FLOAT
-      BOOLEAN
-      DATE
-      TIME
-      DATETIME
-      JSON
-      KIND
-      l_ID
-      l_STRING
-      l_INT
-      l_FLOAT
-      l_BOOLEAN
-      l_DATE
-      l_TIME
-      l_DATETIME
-      l_JSON
-      l_KIND
-    }
-"""
-
-InstanceSetDetailsFragment = """
-    kindId
-    kind {
-      schema {
-        id
-        name
-        type
-        modifiers
-        typeKindId
-      }
-    }
-    token
-    fieldIds
-    records {
-      ID
-      STRING
-      INT
-      FLOAT
-      BOOLEAN
-      DATE
-      TIME
-      DATETIME
-      JSON
-      KIND
-      l_ID
-      l_STRING
-      l_INT
-      l_FLOAT
-      l_BOOLEAN
-      l_DATE
-      l_TIME
-      l_DATETIME
-      l_JSON
-      l_KIND
-    }
-  """
-
-LinkDetailsFragment = """
-    id
-    relation {
-      id
-    }
-    fromKind {
-      id
-    }
-    toKind {
-      id
-    }
-    fromInstance {
-      id
-    }
-    toInstance {
-      id
-    }
-    name
-    weight
-    fromOffset
-    fromSpan
-    toOffset
-    toSpan
-"""
+from settings import KINDDB_SERVICE_URL, KIND_CACHE_SIZE, KIND_CACHE_TTL, \
+    RECURSION_MAX_DEPTH, RECURSION_CONCURRENCY, PAGE_SIZE, MAX_BUFFERED_RECORDS, \
+    BULK_BATCH_SIZE, BULK_MAX_BATCH_BYTES, BULK_CONCURRENCY, BULK_RETRIES, BULK_BACKOFF, \
+    WRITE_BEHIND_WINDOW, WRITE_BEHIND_MAX_ITEMS, KINDDB_PERSISTED_QUERIES, MULTIPLEX_WINDOW, MULTIPLEX_MAX_OPERATIONS
+from shared import json_codec
+from .queries import kindDetailsFragment, InstanceDetailsFragment, InstanceSetDetailsFragment, \
+    LinkDetailsFragment, encode_request, KIND_QUERY, ALL_KINDS_QUERY, INSTANCE_QUERY, ADD_RELATION_MUTATION, \
+    LINK_QUERY, ADD_LINK_MUTATION, ADD_LINKS_MUTATION, ALL_INSTANCES_QUERY, ADD_INSTANCE_MUTATION, \
+    ADD_INSTANCE_SET_MUTATION, ADD_FIELDS_MUTATION, ADD_KIND_MUTATION, KIND_OPERATION, KIND_BY_ID_OPERATION, \
+    INSTANCE_OPERATION, LINK_OPERATION, multiplexed_document, multiplexed_variables, split_multiplexed
+from .record_encoder import field_encoder, encoder_for_kind, encoder_for_schema
+from .columnar import ColumnarInstanceSet
+from .http_pool import shared_pool
+from .multiplexer import QueryMultiplexer
+from .kind_cache import KindCache, KIND_CHANGED_TRIGGERS
+from .nested import NestedInstanceResolver
+from .bulk import BulkWriter
+from .write_buffer import WriteBehindBuffer
 
 
 logger = logging.getLogger(__name__)
-logging.basicConfig(stream=sys.stdout, level=LOG_LEVEL)
 
 
 class KindDBSvc:
 
     def _create_fieldValueObject(self, fType, value, modifiers):
-        isList = "LIST" in modifiers
-        fieldValueObject = None
-
-        if fType == "ID":
-            fieldValueObject = ({"l_ID": value} if isList else {"ID": value})
-        if fType == "STRING":
-            fieldValueObject = ({"l_STRING": value} if isList else {"STRING": value})
-        if fType == "INT":
-            fieldValueObject = ({"l_INT": value} if isList else {"INT": value})
-        if fType == "FLOAT":
-            fieldValueObject = ({"l_FLOAT": value} if isList else {"FLOAT": value})
-        if fType == "BOOLEAN":
-            fieldValueObject = ({"l_BOOLEAN": value} if isList else {"BOOLEAN": value})
-        if fType == "DATE":
-            fieldValueObject = ({"l_DATE": value} if isList else {"DATE": value})
-        if fType == "TIME":
-            fieldValueObject = ({"l_TIME": value} if isList else {"TIME": value})
-        if fType == "DATETIME":
-            fieldValueObject = ({"l_DATETIME": value} if isList else {"DATETIME": value})
-        if fType == "BOOLEAN":
-            fieldValueObject = ({"l_BOOLEAN": value} if isList else {"BOOLEAN": value})
-        if fType == "JSON":
-            fieldValueObject = ({"l_JSON": value} if isList else {"JSON": value})
-        if fType == "KIND":
-            fieldValueObject = ({"l_KIND": value} if isList else {"KIND": value})
-
-        return fieldValueObject
+        return field_encoder(fType, modifiers)(value)
 
     def _instanceSetFromObjects(self, schema, objects):
-        fieldIds = [f['id'] for f in schema if f['name'] != 'id']
-
-        instanceIds = []
-        records = []
-
-        for obj in objects:
-            record = []
-            for field in schema:
-                val = obj.get(field['name'], None)
-
-                if field['name'] == 'id':
-                    instanceIds.append(val)
-                else:
-                    record.append(self._create_fieldValueObject(field['type'], val, field['modifiers']))
-
-            records.append(record)
-
-        return fieldIds, instanceIds, records
+        return encoder_for_schema(schema).encode_instance_set(objects)
 
     def _object_to_addInstanceInput(self, kind, instance):
-        addInstanceInput = {
-            "kindId": kind['id'],
-            "id": instance["id"],
-            "fieldIds": [],
-            "fieldValues": []
-        }
-
-        for k, v in instance.items():
-            lis = list(filter(lambda x: x["name"] == k, kind["schema"]))
-            if len(lis) > 0:
-                field = lis[0]
-            else:
-                raise IOError("Field name specified in instance input not found in kind schema.")
-            addInstanceInput["fieldIds"].append(field["id"])
-            addInstanceInput["fieldValues"].append(self._create_fieldValueObject(field["type"], v, field["modifiers"]))
-
-        return addInstanceInput
+        return encoder_for_kind(kind).encode_instance(instance)
 
     def _check_response(self, json_resp):
 
@@ -214,7 +42,42 @@ class KindDBSvc:
         else:
             pass
 
-    def __init__(self, tenantId, loop=asyncio.get_event_loop(), svcUrl = KINDDB_SERVICE_URL):
+    def _persisted_query_error(self, json_resp):
+        for err in json_resp.get('errors') or []:
+            message = err.get('message') if isinstance(err, dict) else str(err)
+            if message in ('PersistedQueryNotFound', 'PersistedQueryNotSupported'):
+                return message
+        return None
+
+    async def _post(self, body):
+        if self.concurrency is None:
+            return json_codec.loads(await self.pool.post(self.svcUrl, body, self.headers))
+
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.concurrency)
+        async with self.semaphore:
+            return json_codec.loads(await self.pool.post(self.svcUrl, body, self.headers))
+
+    async def _execute(self, document, variables, persisted=True):
+        if not (persisted and self.persistedQueries):
+            return await self._post(encode_request(document, variables))
+
+        out = await self._post(encode_request(document, variables, includeQuery=False, persisted=True))
+        error = self._persisted_query_error(out)
+        if error == 'PersistedQueryNotSupported':
+            logger.warning("KindDB does not support persisted queries, sending full documents")
+            self.persistedQueries = False
+        if error is not None:
+            out = await self._post(encode_request(document, variables, persisted=self.persistedQueries))
+        return out
+
+    async def _execute_operation(self, operation, document, variables):
+        if self.multiplexer is None:
+            return await self._execute(document, variables)
+        return await self.multiplexer.submit(operation, variables)
+
+    def __init__(self, tenantId, loop=None, svcUrl = KINDDB_SERVICE_URL, kindCache=None,
+                 persistedQueries=KINDDB_PERSISTED_QUERIES, pool=None, concurrency=None):
 
         self.loop = loop
 
@@ -229,82 +92,139 @@ class KindDBSvc:
             self.svcUrl = svcUrl
 
         self.headers = {"Content-Type": "application/json"}
-        try:
-            self.session = aiohttp.ClientSession(loop=loop)
-        except Exception as e:
-            logger.error(e)
+        self.persistedQueries = persistedQueries
+        self.kindCache = kindCache if kindCache is not None else KindCache(KIND_CACHE_SIZE, KIND_CACHE_TTL)
+        # (kindId, kindName) -> future of the getKind query in flight for it.
+        self.kindQueries = {}
+        self.writeBuffer = None
+        self.multiplexer = None
+        self.pool = pool if pool is not None else shared_pool()
+        self.concurrency = concurrency
+        self.semaphore = None
 
     async def close(self):
-        await self.session.close()
+        # The connection pool is shared, closing a client only drains its own writes.
+        await self.flush()
+
+    def poolStats(self):
+        return self.pool.stats()
+
+    def enableWriteBehind(self, window=WRITE_BEHIND_WINDOW, maxItems=WRITE_BEHIND_MAX_ITEMS):
+        if self.writeBuffer is None:
+            self.writeBuffer = WriteBehindBuffer(self, window=window, maxItems=maxItems)
+        return self.writeBuffer
+
+    async def disableWriteBehind(self):
+        buffer, self.writeBuffer = self.writeBuffer, None
+        if buffer is not None:
+            await buffer.close()
+
+    async def flush(self):
+        if self.writeBuffer is not None:
+            await self.writeBuffer.flush()
+        if self.multiplexer is not None:
+            await self.multiplexer.flush()
+
+    def enableMultiplexing(self, window=MULTIPLEX_WINDOW, maxOperations=MULTIPLEX_MAX_OPERATIONS):
+        if self.multiplexer is None:
+            self.multiplexer = QueryMultiplexer(self, window=window, maxOperations=maxOperations)
+        return self.multiplexer
+
+    async def disableMultiplexing(self):
+        multiplexer, self.multiplexer = self.multiplexer, None
+        if multiplexer is not None:
+            await multiplexer.flush()
+
+    def kindCacheStats(self):
+        return self.kindCache.stats()
+
+    def invalidateKind(self, kindId=None, kindName=None):
+        if kindId is None and kindName is None:
+            self.kindCache.clear()
+        else:
+            self.kindCache.invalidate(kindId=kindId, kindName=kindName)
+
+    async def subscribeKindChanges(self, pubsub, triggers=KIND_CHANGED_TRIGGERS):
+        return [await pubsub.subscribe(t, self.kindCache.on_kind_changed) for t in triggers]
 
     async def getKind(self, kindId, kindName):
-        query = string.Template(
-            """query( $tenantId: ID!, $kindId: ID, $kindName: String) {
-                kind(tenantId: $tenantId, id: $kindId, name: $kindName) {
-                    $kindFragment
-                }
-            }
-        """
-        )
+        cached = self.kindCache.get(kindId=kindId, kindName=kindName)
+        if cached is not None:
+            return {"kind": cached}
+
+        # Concurrent misses for the same kind wait for one query.
+        key = (kindId, kindName)
+        query = self.kindQueries.get(key)
+        if query is None:
+            query = self.kindQueries[key] = asyncio.ensure_future(self._queryKind(kindId, kindName))
+            query.add_done_callback(lambda _: self.kindQueries.pop(key, None))
+        return await asyncio.shield(query)
+
+    async def _queryKind(self, kindId, kindName):
         variables = {
             "tenantId": self.tenantId,
             "kindId": kindId,
             "kindName": kindName
         }
-        to_post = {
-            "query": query.safe_substitute(kindFragment=kindDetailsFragment),
-            "variables": variables
-        }
         logger.info("getKind kn: {} kid: {}".format(kindName, kindId))
-        resp = await self.session.post(self.svcUrl, data=json.dumps(to_post), headers=self.headers)
-        txt = await resp.text()
-        out = json.loads(txt)
+        out = await self._execute_operation(KIND_OPERATION, KIND_QUERY, variables)
         if out["data"]["kind"] is None:
             logger.error("No data received from kindDB")
             raise RuntimeError("No data received from kindDB")
         self._check_response(out)
+        self.kindCache.put(out["data"]["kind"])
         return out["data"]
 
+    async def _execute_batch(self, operation, variables):
+        operations = (operation,) * len(variables)
+        out = await self._execute(multiplexed_document(operations),
+                                  multiplexed_variables(self.tenantId, operations, variables), persisted=False)
+        results = []
+        for res in split_multiplexed(operations, out):
+            if 'errors' in res:
+                logger.error(res['errors'])
+                results.append(RuntimeError(res['errors']))
+            else:
+                results.append(res['data'][operation.field])
+        return results
+
+    async def getKinds(self, kindIds):
+        results = [self.kindCache.get(kindId=k) for k in kindIds]
+        missing = [i for (i, r) in enumerate(results) if r is None]
+        if len(missing) == 0:
+            return results
+
+        logger.info("getKinds kids: {}".format([kindIds[i] for i in missing]))
+        kinds = await self._execute_batch(KIND_BY_ID_OPERATION, [{"kindId": kindIds[i]} for i in missing])
+        for i, kind in zip(missing, kinds):
+            if kind is not None and not isinstance(kind, Exception):
+                self.kindCache.put(kind)
+            results[i] = kind
+        return results
+
     async def getKindID(self, kindName):
-        res = await self.getAllInstances(kindName="Kind")
-        base = res.get("allInstances")
-        if base is not None:
-            records = base.get("records")
-            matches = [r for r in records if r[1].get("STRING") == kindName]
-            if len(matches) > 0:
-                return matches[0][0].get("ID")
+        kindId = self.kindCache.get_id(kindName)
+        if kindId is not None:
+            return kindId
 
-        return None
+        try:
+            kind = await self.getKind(kindId=None, kindName=kindName)
+        except RuntimeError as e:
+            logger.warning("Unable to resolve kind id for {}: {}".format(kindName, e))
+            return None
+        return kind["kind"].get("id")
 
     async def allKinds(self):
-        query = string.Template("""
-            query($tenantId: ID!) {
-                allKinds(tenantId: $tenantId) {
-                    $kindFragment
-                }
-            }
-        """)
         variables = {
             "tenantId": self.tenantId
         }
-        to_post = {
-            "query": query.safe_substitute(kindFragment=kindDetailsFragment),
-            "variables": variables
-        }
-        resp = await self.session.post(self.svcUrl, data=json.dumps(to_post), headers=self.headers)
-        txt = await resp.text()
-        out = json.loads(txt)
+        out = await self._execute(ALL_KINDS_QUERY, variables)
         self._check_response(out)
+        for kind in out["data"]["allKinds"] or []:
+            self.kindCache.put(kind)
         return out["data"]
 
     async def getInstance(self, kindId, kindName, instanceId):
-        query = string.Template("""
-            query($tenantId: ID!, $instanceRef: InstanceRefInput!) {
-                instance(tenantId: $tenantId, instanceRef: $instanceRef) {
-                  $instanceDetailsFragment
-                }
-            }
-        """)
         variables = {
             "tenantId": self.tenantId,
             "instanceRef": {
@@ -313,41 +233,29 @@ class KindDBSvc:
                 "kindName": kindName
             }
         }
-        to_post = {
-            "query": query.safe_substitute(instanceDetailsFragment=InstanceDetailsFragment),
-            "variables": variables
-        }
-        resp = await self.session.post(self.svcUrl, data=json.dumps(to_post), headers=self.headers)
-        txt = await resp.text()
-        out = json.loads(txt)
+        out = await self._execute_operation(INSTANCE_OPERATION, INSTANCE_QUERY, variables)
 
         logger.info("getInstance kid: {}".format(kindId))
         self._check_response(out)
         return out["data"]
 
+    async def getInstances(self, instanceRefs):
+        if len(instanceRefs) == 0:
+            return []
+        logger.info("getInstances count: {}".format(len(instanceRefs)))
+        return await self._execute_batch(INSTANCE_OPERATION, [{"instanceRef": ref} for ref in instanceRefs])
+
     async def getInstanceByName(self, kindName, instanceId):
         k_id = await self.getKindID(kindName=kindName)
         return await self.getInstance(kindId=k_id, instanceId=instanceId, kindName=kindName)
 
     async def addRelation(self, addRelationInput):
-        query = string.Template(
-            """mutation($tenantId: ID!, $addRelationInput: AddRelationInput!) {
-                addRelation(tenantId: $tenantId, input: $addRelationInput)
-            }
-        """
-        )
         variables = {
             "tenantId": self.tenantId,
             "addRelationInput": addRelationInput
         }
-        to_post = {
-            "query": query.safe_substitute(kindFragment=kindDetailsFragment),
-            "variables": variables
-        }
         logger.info("Add relation: {} ".format(addRelationInput))
-        resp = await self.session.post(self.svcUrl, data=json.dumps(to_post), headers=self.headers)
-        txt = await resp.text()
-        out = json.loads(txt)
+        out = await self._execute(ADD_RELATION_MUTATION, variables)
         self._check_response(out)
         return out["data"]
 
@@ -356,84 +264,40 @@ class KindDBSvc:
         return await self.getInstance(kindId=k_id, kindName=kindName, instanceId=instanceId)
 
     async def getLink(self, linkId):
-        query = string.Template("""
-            query($tenantId: ID!, $id: ID!) {
-                link(tenantId: $tenantId, id: $id) {
-                  $linkDetailsFragment
-                }
-              }
-        """)
         variables = {
             "tenantId": self.tenantId,
             "id": linkId
         }
-        to_post = {
-            "query": query.safe_substitute(linkDetailsFragment=LinkDetailsFragment),
-            "variables": variables
-        }
-        resp = await self.session.post(self.svcUrl, data=json.dumps(to_post), headers=self.headers)
-        txt = await resp.text()
-        out = json.loads(txt)
+        out = await self._execute_operation(LINK_OPERATION, LINK_QUERY, variables)
         logger.info("getLink id: {}".format(linkId))
         self._check_response(out)
         return out["data"]
 
     async def addLink(self, addLinkInput):
-        query = string.Template("""
-            mutation($tenantId: ID!, $addLinkInput: AddLinkInput!) {
-                addLink(tenantId: $tenantId, input: $addLinkInput)
-            }
-        """)
+        if self.writeBuffer is not None:
+            return await self.writeBuffer.addLink(addLinkInput)
+
         variables = {
             "tenantId": self.tenantId,
             "addLinkInput": addLinkInput
         }
-        to_post = {
-            "query": query.template,
-            "variables": variables
-        }
-        resp = await self.session.post(self.svcUrl, data=json.dumps(to_post), headers=self.headers)
-        txt = await resp.text()
-        out = json.loads(txt)
+        out = await self._execute(ADD_LINK_MUTATION, variables)
         logger.info("addLink: {}".format(addLinkInput))
         self._check_response(out)
         return out["data"]
 
     async def addLinks(self, addLinkInputs):
-        query = string.Template("""
-            mutation($tenantId: ID!, $addLinkInputs: [AddLinkInput]!) {
-                addLinks(tenantId: $tenantId, input: $addLinkInputs)
-            }
-        """)
         variables = {
             "tenantId": self.tenantId,
             "addLinkInputs": addLinkInputs
         }
-        to_post = {
-            "query": query.template,
-            "variables": variables
-        }
-        resp = await self.session.post(self.svcUrl, data=json.dumps(to_post), headers=self.headers)
-        txt = await resp.text()
-        out = json.loads(txt)
+        out = await self._execute(ADD_LINKS_MUTATION, variables)
         logger.info("addLinks: {}".format(addLinkInputs))
         self._check_response(out)
         return out["data"]
 
-    async def getAllInstances(self, kindId=None, kindName=None, fieldIds=None, take=0, recursion=False, token=None):
-        query = string.Template("""
-              query($tenantId: ID!, $kindId: ID, $kindName: String, $take: Int, $token: String) {
-                allInstances(
-                  tenantId: $tenantId
-                  kindId: $kindId
-                  kindName: $kindName
-                  take: $take
-                  token: $token
-                ) {
-                  $InstanceSetDetails
-                }
-              }
-        """)
+    async def getAllInstances(self, kindId=None, kindName=None, fieldIds=None, take=0, recursion=False, token=None,
+                              maxDepth=RECURSION_MAX_DEPTH, concurrency=RECURSION_CONCURRENCY):
         variables = {
             "tenantId": self.tenantId,
             "kindId": kindId,
@@ -442,58 +306,15 @@ class KindDBSvc:
             "take": take,
             "token": token
         }
-        to_post = {
-            "query": query.safe_substitute(InstanceSetDetails=InstanceSetDetailsFragment),
-            "variables": variables
-        }
-        resp = await self.session.post(self.svcUrl, data=json.dumps(to_post), headers=self.headers)
-        txt = await resp.text()
-        out = json.loads(txt)
+        out = await self._execute(ALL_INSTANCES_QUERY, variables)
 
         if out["data"]["allInstances"] is None:
             return None
 
         if recursion:
-            schema = out['data']['allInstances']['kind']['schema']
-            schema_map = dict(enumerate(schema))
-            ks = {i: f for (i, f) in schema_map.items() if f['type'] == 'KIND'}
-            if len(ks) > 0:
-                insts = out['data']['allInstances']['records']
-                logger.debug("Beginning Nesting")
-                nested_data = {i: await self.getAllInstances(kindId=f['typeKindId'], recursion=True)
-                               for (i, f) in ks.items()}
-                new_row = []
-                for row in insts:
-                    for i, d in nested_data.items():
-                        if d is not None:
-                            to_replace = row[i]
-                            if len(ks[i]['modifiers']) > 0:
-                                new_to_replace = []
-                                for a in to_replace['l_KIND']:
-                                    try:
-                                        new_to_replace.append(
-                                            [rs for rs in d['allInstances']['records'] if rs[0]['ID'] == a][0]
-                                        )
-                                    except:
-                                        new_to_replace.append(a)
-                                row[i]['l_KIND'] = new_to_replace
-                                new_row.append(row)
-                            elif to_replace['KIND'] is not None:
-                                try:
-                                    row[i]['KIND'] = \
-                                        [r for r in d['allInstances']['records'] if r[0]['ID'] == to_replace['KIND']][0]
-                                except Exception:
-                                    logger.error(
-                                        "Invalid kind id in KIND field for: {} kid: {}".format(kindName, kindId))
-                                    logger.error(str(ks[i]))
-                                    pass
-                            else:
-                                row[i]['KIND'] = None
-                        else:
-                            row[i]['KIND'] = None
-
-                        new_row.append(row)
-                out['data']['allInstances']['records'] = new_row
+            self._check_response(out)
+            resolver = NestedInstanceResolver(lambda k: self.getAllInstances(kindId=k), maxDepth, concurrency)
+            await resolver.resolve(out['data']['allInstances'])
 
         logger.info("getAllInstances kn: {} kid: {}".format(kindName, kindId))
         self._check_response(out)
@@ -508,23 +329,59 @@ class KindDBSvc:
             logger.error("Unable to get kind {} ".format(kindName))
             return None
 
+    async def getAllInstancesColumnar(self, kindId=None, kindName=None, take=0, token=None):
+        res = await self.getAllInstances(kindId=kindId, kindName=kindName, take=take, token=token)
+        if res is None or res.get("allInstances") is None:
+            return None
+        return ColumnarInstanceSet.from_instance_set(res["allInstances"])
+
+    async def iterInstancePages(self, kindId=None, kindName=None, pageSize=PAGE_SIZE, prefetch=True,
+                                maxBufferedRecords=MAX_BUFFERED_RECORDS, columnar=False):
+        # At most the page being consumed and the page being prefetched are
+        # held at once, so prefetching is dropped when two pages exceed the cap.
+        pageSize = max(1, min(pageSize, maxBufferedRecords))
+        prefetch = prefetch and 2 * pageSize <= maxBufferedRecords
+
+        async def fetch(token):
+            res = await self.getAllInstances(kindId=kindId, kindName=kindName, take=pageSize, token=token)
+            return res.get("allInstances") if res is not None else None
+
+        pending = asyncio.ensure_future(fetch(None))
+        token = None
+        try:
+            while pending is not None:
+                page = await pending
+                pending = None
+                if page is None:
+                    break
+
+                previous, token = token, page.get("token")
+                more = bool(token) and token != previous and len(page.get("records") or []) > 0
+                if more and prefetch:
+                    pending = asyncio.ensure_future(fetch(token))
+                yield ColumnarInstanceSet.from_instance_set(page) if columnar else page
+                if more and not prefetch:
+                    pending = asyncio.ensure_future(fetch(token))
+        finally:
+            if pending is not None:
+                pending.cancel()
+
+    async def iterInstances(self, kindId=None, kindName=None, pageSize=PAGE_SIZE, prefetch=True,
+                            maxBufferedRecords=MAX_BUFFERED_RECORDS):
+        async for page in self.iterInstancePages(kindId=kindId, kindName=kindName, pageSize=pageSize,
+                                                 prefetch=prefetch, maxBufferedRecords=maxBufferedRecords):
+            for record in page.get("records") or []:
+                yield record
+
     async def addInstance(self, addInstanceInput):
-        query = string.Template("""
-            mutation($tenantId: ID!, $addInstanceInput: AddInstanceInput!) {
-                addInstance(tenantId: $tenantId, input: $addInstanceInput)
-      }
-        """)
+        if self.writeBuffer is not None:
+            return await self.writeBuffer.addInstance(addInstanceInput)
+
         variables = {
             "tenantId": self.tenantId,
             "addInstanceInput": addInstanceInput
         }
-        to_post = {
-            "query": query.template,
-            "variables": variables
-        }
-        resp = await self.session.post(self.svcUrl, data=json.dumps(to_post), headers=self.headers)
-        txt = await resp.text()
-        out = json.loads(txt)
+        out = await self._execute(ADD_INSTANCE_MUTATION, variables)
         self._check_response(out)
         return out["data"]
 
@@ -549,27 +406,16 @@ class KindDBSvc:
             return None
 
     async def addInstanceSet(self, addInstanceSetInput):
-        query = string.Template("""
-          mutation($tenantId: ID!, $addInstanceSetInput: AddInstanceSetInput!) {
-            addInstanceSet(tenantId: $tenantId, input: $addInstanceSetInput)
-        }
-        """)
         variables = {
             "tenantId": self.tenantId,
             "addInstanceSetInput": addInstanceSetInput
         }
-        to_post = {
-            "query": query.template,
-            "variables": variables
-        }
-        resp = await self.session.post(self.svcUrl, data=json.dumps(to_post), headers=self.headers)
-        txt = await resp.text()
-        out = json.loads(txt)
+        out = await self._execute(ADD_INSTANCE_SET_MUTATION, variables)
         self._check_response(out)
         return out["data"]
 
     async def addInstancesByKind(self, kind, instances):
-        fieldIds, instanceIds, records = self._instanceSetFromObjects(kind['schema'], instances)
+        fieldIds, instanceIds, records = encoder_for_kind(kind).encode_instance_set(instances)
         addInstanceSetInput = {
             "kindId": kind['id'],
             "ids": instanceIds,
@@ -579,6 +425,21 @@ class KindDBSvc:
 
         return await self.addInstanceSet(addInstanceSetInput)
 
+    async def bulkAddInstancesByKind(self, kind, instances, batchSize=BULK_BATCH_SIZE, maxBatchBytes=BULK_MAX_BATCH_BYTES,
+                                     concurrency=BULK_CONCURRENCY, retries=BULK_RETRIES, backoff=BULK_BACKOFF):
+        fieldIds, instanceIds, records = encoder_for_kind(kind).encode_instance_set(instances)
+        writer = BulkWriter(self.addInstanceSet, batchSize=batchSize, maxBatchBytes=maxBatchBytes,
+                            concurrency=concurrency, retries=retries, backoff=backoff)
+        return await writer.write(kind['id'], fieldIds, instanceIds, records)
+
+    async def bulkAddInstancesByKindName(self, kindName, instances, **options):
+        kind = await self.getKind(kindId=None, kindName=kindName)
+        return await self.bulkAddInstancesByKind(kind['kind'], instances, **options)
+
+    async def bulkAddInstancesByKindId(self, kindId, instances, **options):
+        kind = await self.getKind(kindId=kindId, kindName=None)
+        return await self.bulkAddInstancesByKind(kind['kind'], instances, **options)
+
     async def addInstancesByKindName(self, kindName, instances):
         try:
             kind = await self.getKind(kindId=None, kindName=kindName)
@@ -599,11 +460,7 @@ class KindDBSvc:
 
     async def addFields(self, kindId, fields):
         logger.info('addFields')
-        query = string.Template("""
-        mutation($tenantId: ID!, $addFieldsInput: AddFieldsInput!) {
-            addFields(tenantId: $tenantId, input: $addFieldsInput)
-        }
-        """)
+        self.kindCache.invalidate(kindId=kindId)
         variables = {
             "tenantId": self.tenantId,
             "addFieldsInput": {
@@ -611,33 +468,25 @@ class KindDBSvc:
                 "fields": fields
             }
         }
-        to_post = {
-            "query": query.template,
-            "variables": variables
-        }
-        resp = await self.session.post(self.svcUrl, data=json.dumps(to_post), headers=self.headers)
-        txt = await resp.text()
-        out = json.loads(txt)
+        try:
+            out = await self._execute(ADD_FIELDS_MUTATION, variables)
+        finally:
+            # Again after the mutation: a getKind that raced it may have
+            # re-cached the old schema.
+            self.kindCache.invalidate(kindId=kindId)
         self._check_response(out)
         return out["data"]
 
     async def addKind(self, addKindInput):
         logger.info('addKind({})'.format(addKindInput))
-        query = string.Template("""
-        mutation($tenantId: ID!, $addKindInput: AddKindInput!) {
-          addKind(tenantId: $tenantId, input: $addKindInput)
-        }
-        """)
+        self.kindCache.invalidate(kindId=addKindInput.get("id"), kindName=addKindInput.get("name"))
         variables = {
             "tenantId": self.tenantId,
             "addKindInput": addKindInput
         }
-        to_post = {
-            "query": query.template,
-            "variables": variables
-        }
-        resp = await self.session.post(self.svcUrl, data=json.dumps(to_post), headers=self.headers)
-        txt = await resp.text()
-        out = json.loads(txt)
+        try:
+            out = await self._execute(ADD_KIND_MUTATION, variables)
+        finally:
+            self.kindCache.invalidate(kindId=addKindInput.get("id"), kindName=addKindInput.get("name"))
         self._check_response(out)
         return out["data"]
\ No newline at end of file
@@ -0,0 +1,142 @@
+import time
+import random
+import asyncio
+import logging
+from shared import json_codec
+
+logger = logging.getLogger(__name__)
+
+
+class ChunkResult:
+
+    def __init__(self, index, offset, count, size):
+        self.index = index
+        self.offset = offset
+        self.count = count
+        self.size = size
+        self.attempts = 0
+        self.elapsed = 0.0
+        self.result = None
+        self.error = None
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def to_dict(self):
+        return {
+            "index": self.index,
+            "offset": self.offset,
+            "count": self.count,
+            "bytes": self.size,
+            "attempts": self.attempts,
+            "elapsed": self.elapsed,
+            "error": str(self.error) if self.error is not None else None
+        }
+
+
+class BulkWriteResult:
+
+    def __init__(self, kindId):
+        self.kindId = kindId
+        self.chunks = []
+        self.elapsed = 0.0
+
+    @property
+    def ok(self):
+        return all(c.ok for c in self.chunks)
+
+    @property
+    def written(self):
+        return sum(c.count for c in self.chunks if c.ok)
+
+    @property
+    def failed(self):
+        return [c for c in self.chunks if not c.ok]
+
+    @property
+    def ids(self):
+        ids = []
+        for c in self.chunks:
+            if c.ok and c.result is not None:
+                ids.extend(c.result.get("addInstanceSet") or [])
+        return ids
+
+    def to_dict(self):
+        return {
+            "kindId": self.kindId,
+            "written": self.written,
+            "failed": sum(c.count for c in self.failed),
+            "elapsed": self.elapsed,
+            "chunks": [c.to_dict() for c in self.chunks]
+        }
+
+
+def chunk_records(instanceIds, records, maxRecords, maxBytes):
+    # Chunks are cut at whichever of the record count or the estimated JSON
+    # size is reached first; a single oversized record still gets its own chunk.
+    start = 0
+    size = 0
+    for i, record in enumerate(records):
+        recordSize = len(json_codec.dumps(record)) + len(json_codec.dumps(instanceIds[i])) + 2
+        if i > start and (i - start >= maxRecords or size + recordSize > maxBytes):
+            yield start, instanceIds[start:i], records[start:i], size
+            start, size = i, 0
+        size += recordSize
+    if start < len(records):
+        yield start, instanceIds[start:], records[start:], size
+
+
+class BulkWriter:
+
+    def __init__(self, send, batchSize=1000, maxBatchBytes=4 * 1024 * 1024, concurrency=4,
+                 retries=3, backoff=0.5):
+        self.send = send
+        self.batchSize = batchSize
+        self.maxBatchBytes = maxBatchBytes
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff = backoff
+
+    async def _send_chunk(self, chunk, addInstanceSetInput):
+        started = time.monotonic()
+        while True:
+            chunk.attempts += 1
+            try:
+                chunk.result = await self.send(addInstanceSetInput)
+                chunk.error = None
+                break
+            except Exception as e:
+                chunk.error = e
+                if chunk.attempts > self.retries:
+                    logger.error("Bulk chunk {} failed after {} attempts: {}".format(chunk.index, chunk.attempts, e))
+                    break
+                delay = self.backoff * 2 ** (chunk.attempts - 1)
+                logger.warning("Bulk chunk {} failed, retrying in {:.2f}s: {}".format(chunk.index, delay, e))
+                await asyncio.sleep(delay + random.uniform(0, self.backoff))
+        chunk.elapsed = time.monotonic() - started
+
+    async def write(self, kindId, fieldIds, instanceIds, records):
+        result = BulkWriteResult(kindId)
+        started = time.monotonic()
+        chunks = enumerate(chunk_records(instanceIds, records, self.batchSize, self.maxBatchBytes))
+
+        # Workers pull chunks lazily, so serialization of the next chunk is
+        # interleaved with the sends instead of blocking up front.
+        async def worker():
+            for index, (offset, ids, recs, size) in chunks:
+                chunk = ChunkResult(index, offset, len(recs), size)
+                result.chunks.append(chunk)
+                await self._send_chunk(chunk, {
+                    "kindId": kindId,
+                    "ids": ids,
+                    "fieldIds": fieldIds,
+                    "records": recs
+                })
+
+        await asyncio.gather(*[worker() for _ in range(max(1, self.concurrency))])
+        result.chunks.sort(key=lambda c: c.index)
+        result.elapsed = time.monotonic() - started
+        logger.info("Bulk write kid: {} wrote {} records in {} chunks ({:.2f}s)".format(
+            kindId, result.written, len(result.chunks), result.elapsed))
+        return result
@@ -0,0 +1,163 @@
+import sys
+from array import array
+from .record_encoder import field_value_key
+
+# Scalar numeric fields are packed into typed arrays; nulls are stored as 0
+# and tracked in a validity mask that is only allocated when a null occurs.
+_ARRAY_TYPECODES = {"INT": "q", "FLOAT": "d", "BOOLEAN": "b"}
+_INTERNED_TYPES = ("ID", "STRING", "KIND")
+
+
+class Column:
+    __slots__ = ("name", "fieldId", "type", "isList", "values", "valid")
+
+    def __init__(self, name, fieldId, fType, isList, values, valid=None):
+        self.name = name
+        self.fieldId = fieldId
+        self.type = fType
+        self.isList = isList
+        self.values = values
+        self.valid = valid
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, index):
+        if self.valid is not None and not self.valid[index]:
+            return None
+        value = self.values[index]
+        return bool(value) if self.type == "BOOLEAN" and isinstance(self.values, array) else value
+
+    def __iter__(self):
+        for i in range(len(self.values)):
+            yield self[i]
+
+    def to_list(self):
+        return list(self)
+
+
+def _pack(values, typecode):
+    valid = None
+    packed = array(typecode)
+    for i, v in enumerate(values):
+        if v is None:
+            if valid is None:
+                valid = bytearray(b"\x01") * len(values)
+            valid[i] = 0
+            v = 0
+        packed.append(v)
+    return packed, valid
+
+
+def _build_column(field, raw):
+    fType = field.get("type")
+    isList = "LIST" in (field.get("modifiers") or ())
+
+    if not isList and fType in _ARRAY_TYPECODES:
+        try:
+            values, valid = _pack(raw, _ARRAY_TYPECODES[fType])
+            return Column(field["name"], field["id"], fType, isList, values, valid)
+        except (OverflowError, TypeError):
+            pass
+
+    if fType in _INTERNED_TYPES:
+        intern = sys.intern
+        if isList:
+            raw = [[intern(v) if isinstance(v, str) else v for v in vs] if vs is not None else None for vs in raw]
+        else:
+            raw = [intern(v) if isinstance(v, str) else v for v in raw]
+    return Column(field["name"], field["id"], fType, isList, raw)
+
+
+class RowView:
+    __slots__ = ("_set", "_index")
+
+    def __init__(self, instanceSet, index):
+        self._set = instanceSet
+        self._index = index
+
+    def __getitem__(self, name):
+        return self._set.columns[name][self._index]
+
+    def __getattr__(self, name):
+        try:
+            return self._set.columns[name][self._index]
+        except KeyError:
+            raise AttributeError(name)
+
+    def get(self, name, default=None):
+        column = self._set.columns.get(name)
+        return column[self._index] if column is not None else default
+
+    def to_dict(self):
+        return {name: column[self._index] for (name, column) in self._set.columns.items()}
+
+
+class ColumnarInstanceSet:
+
+    def __init__(self, kindId, token, columns, length):
+        self.kindId = kindId
+        self.token = token
+        self.columns = columns
+        self.length = length
+
+    @classmethod
+    def from_instance_set(cls, instanceSet):
+        schema = instanceSet["kind"]["schema"]
+        records = instanceSet.get("records") or []
+
+        # Records follow fieldIds when the server reports them, schema order otherwise.
+        byId = {f["id"]: f for f in schema}
+        fieldIds = instanceSet.get("fieldIds") or []
+        if len(fieldIds) > 0 and all(fid in byId for fid in fieldIds) and \
+                (len(records) == 0 or len(records[0]) == len(fieldIds)):
+            fields = [byId[fid] for fid in fieldIds]
+        else:
+            fields = schema
+
+        columns = {}
+        for i, field in enumerate(fields):
+            key = field_value_key(field.get("type"), "LIST" in (field.get("modifiers") or ()))
+            raw = [r[i].get(key) if i < len(r) and r[i] is not None and key is not None else None
+                   for r in records]
+            columns[field["name"]] = _build_column(field, raw)
+
+        return cls(instanceSet.get("kindId"), instanceSet.get("token"), columns, len(records))
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        for i in range(self.length):
+            yield RowView(self, i)
+
+    @property
+    def names(self):
+        return list(self.columns.keys())
+
+    def column(self, name):
+        return self.columns[name]
+
+    def row(self, index):
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError(index)
+        return RowView(self, index)
+
+    def to_numpy(self):
+        import numpy
+
+        out = {}
+        for name, column in self.columns.items():
+            if isinstance(column.values, array):
+                values = numpy.frombuffer(column.values, dtype=column.values.typecode)
+                if column.type == "BOOLEAN":
+                    values = values.astype(bool)
+                if column.valid is not None:
+                    mask = numpy.frombuffer(bytes(column.valid), dtype=numpy.uint8) == 0
+                    values = numpy.ma.masked_array(values, mask=mask)
+                out[name] = values
+            else:
+                out[name] = numpy.array(column.values, dtype=object)
+        return out
@@ -0,0 +1,115 @@
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+# asyncio DataLoader: load() calls made within one event-loop tick are
+# collected and passed to `batchFn` as one list of keys, and every result is
+# cached for the lifetime of the loader (one GraphQL request). `batchFn` returns
+# one value per key in the same order; an Exception value rejects that key only.
+class DataLoader:
+
+    def __init__(self, batchFn, maxBatchSize=100, cache=True, cacheKeyFn=None):
+        self.batchFn = batchFn
+        self.maxBatchSize = maxBatchSize
+        self.cache = cache
+        self.cacheKeyFn = cacheKeyFn if cacheKeyFn is not None else (lambda key: key)
+
+        self.futures = {}
+        self.queue = []
+        self.scheduled = False
+
+        self.loads = 0
+        self.batches = 0
+
+    def load(self, key):
+        self.loads += 1
+        cacheKey = self.cacheKeyFn(key)
+        if self.cache and cacheKey in self.futures:
+            return self.futures[cacheKey]
+
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+        if self.cache:
+            self.futures[cacheKey] = future
+        self.queue.append((key, future))
+        if not self.scheduled:
+            self.scheduled = True
+            loop.call_soon(self._dispatch)
+        return future
+
+    def load_many(self, keys):
+        return asyncio.gather(*[self.load(key) for key in keys])
+
+    def prime(self, key, value):
+        cacheKey = self.cacheKeyFn(key)
+        if cacheKey not in self.futures:
+            future = asyncio.get_event_loop().create_future()
+            future.set_result(value)
+            self.futures[cacheKey] = future
+
+    def clear(self, key=None):
+        if key is None:
+            self.futures.clear()
+        else:
+            self.futures.pop(self.cacheKeyFn(key), None)
+
+    def _dispatch(self):
+        queue, self.queue = self.queue, []
+        self.scheduled = False
+        for start in range(0, len(queue), self.maxBatchSize):
+            asyncio.ensure_future(self._run(queue[start:start + self.maxBatchSize]))
+
+    async def _run(self, batch):
+        self.batches += 1
+        try:
+            values = await self.batchFn([key for (key, _) in batch])
+            if len(values) != len(batch):
+                raise RuntimeError("DataLoader batch function returned {} values for {} keys".format(
+                    len(values), len(batch)))
+        except Exception as e:
+            logger.error("DataLoader batch failed: {}".format(e))
+            values = [e] * len(batch)
+
+        for (key, future), value in zip(batch, values):
+            if future.done():
+                continue
+            if isinstance(value, Exception):
+                future.set_exception(value)
+                self.futures.pop(self.cacheKeyFn(key), None)
+            else:
+                future.set_result(value)
+
+
+# The request-scoped loaders for KindDB lookups. The client is only created
+# when a resolver first uses a loader.
+class KindDBLoaders:
+
+    def __init__(self, clientFactory, maxBatchSize=100):
+        self.clientFactory = clientFactory
+        self.maxBatchSize = maxBatchSize
+        self._client = None
+        self._kind = None
+        self._instance = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = self.clientFactory()
+        return self._client
+
+    @property
+    def kind(self):
+        if self._kind is None:
+            self._kind = DataLoader(self.client.getKinds, maxBatchSize=self.maxBatchSize)
+        return self._kind
+
+    @property
+    def instance(self):
+        # Keys are (kindId, kindName, instanceId) tuples.
+        if self._instance is None:
+            self._instance = DataLoader(
+                lambda keys: self.client.getInstances([{"kindId": k, "kindName": n, "id": i} for (k, n, i) in keys]),
+                maxBatchSize=self.maxBatchSize)
+        return self._instance
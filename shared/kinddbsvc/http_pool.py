@@ -0,0 +1,150 @@
+import time
+import asyncio
+import logging
+import aiohttp
+from settings import KINDDB_POOL_LIMIT, KINDDB_POOL_LIMIT_PER_HOST, KINDDB_KEEPALIVE_TIMEOUT, \
+    KINDDB_DNS_CACHE_TTL, KINDDB_UNIX_SOCKET
+
+logger = logging.getLogger(__name__)
+
+
+class ConnectionPoolConfig:
+
+    def __init__(self, limit=KINDDB_POOL_LIMIT, limitPerHost=KINDDB_POOL_LIMIT_PER_HOST,
+                 keepaliveTimeout=KINDDB_KEEPALIVE_TIMEOUT, ttlDnsCache=KINDDB_DNS_CACHE_TTL,
+                 unixSocket=KINDDB_UNIX_SOCKET, enableCleanupClosed=True):
+        self.limit = limit
+        self.limitPerHost = limitPerHost
+        self.keepaliveTimeout = keepaliveTimeout
+        self.ttlDnsCache = ttlDnsCache
+        self.unixSocket = unixSocket
+        self.enableCleanupClosed = enableCleanupClosed
+
+
+# One keep-alive connection pool (connector + ClientSession) that any number of
+# KindDBSvc instances and tenants in the process can share. The session is
+# created lazily on first use in the running loop, and recreated (closing the
+# previous one) when used from another loop.
+class ConnectionPool:
+
+    def __init__(self, config=None):
+        self.config = config if config is not None else ConnectionPoolConfig()
+        self.connector = None
+        self.session = None
+        self.loop = None
+
+        self.requests = 0
+        self.errors = 0
+        self.inFlight = 0
+        self.peakInFlight = 0
+        self.saturated = 0
+        self.totalTime = 0.0
+        self.connectionsCreated = 0
+        self.connectionsReused = 0
+
+    def _create_connector(self, loop):
+        c = self.config
+        if c.unixSocket:
+            return aiohttp.UnixConnector(path=c.unixSocket, limit=c.limit, limit_per_host=c.limitPerHost,
+                                         keepalive_timeout=c.keepaliveTimeout, loop=loop)
+        return aiohttp.TCPConnector(limit=c.limit, limit_per_host=c.limitPerHost,
+                                    keepalive_timeout=c.keepaliveTimeout, use_dns_cache=c.ttlDnsCache != 0,
+                                    ttl_dns_cache=c.ttlDnsCache or None, enable_cleanup_closed=c.enableCleanupClosed,
+                                    loop=loop)
+
+    # Counts connections through the public tracing signals instead of reading
+    # the connector's internals.
+    def _trace_config(self):
+        async def on_create(session, context, params):
+            self.connectionsCreated += 1
+
+        async def on_reuse(session, context, params):
+            self.connectionsReused += 1
+
+        trace = aiohttp.TraceConfig()
+        trace.on_connection_create_end.append(on_create)
+        trace.on_connection_reuseconn.append(on_reuse)
+        return trace
+
+    def _close_previous(self, session, loop):
+        if session is None or session.closed:
+            return
+        if loop is not None and loop.is_running():
+            # Still serving in another thread: close it there.
+            asyncio.run_coroutine_threadsafe(session.close(), loop)
+            return
+        # Its loop is stopped or closed and cannot run session.close(), so the
+        # connector is closed directly (its transports go with a closed loop).
+        connector = session.connector
+        session.detach()
+        try:
+            connector.close()
+        except Exception as e:
+            logger.debug("Problem closing connector of a closed loop: {}".format(e))
+
+    def _ensure_session(self):
+        loop = asyncio.get_event_loop()
+        if self.session is None or self.session.closed or self.loop is not loop:
+            if self.loop is not loop:
+                self._close_previous(self.session, self.loop)
+            self.loop = loop
+            self.connector = self._create_connector(loop)
+            self.session = aiohttp.ClientSession(connector=self.connector, trace_configs=[self._trace_config()],
+                                                 loop=loop)
+        return self.session
+
+    async def post(self, url, data, headers):
+        session = self._ensure_session()
+        limit = self.config.limit
+        if limit and self.inFlight >= limit:
+            self.saturated += 1
+
+        self.requests += 1
+        self.inFlight += 1
+        self.peakInFlight = max(self.peakInFlight, self.inFlight)
+        started = time.monotonic()
+        try:
+            async with session.post(url, data=data, headers=headers) as resp:
+                return await resp.read()
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            self.inFlight -= 1
+            self.totalTime += time.monotonic() - started
+
+    def stats(self):
+        limit = self.config.limit
+        return {
+            "limit": limit,
+            "limitPerHost": self.config.limitPerHost,
+            "requests": self.requests,
+            "errors": self.errors,
+            "inFlight": self.inFlight,
+            "peakInFlight": self.peakInFlight,
+            "saturation": self.inFlight / limit if limit else 0.0,
+            "saturatedRequests": self.saturated,
+            "meanLatency": self.totalTime / self.requests if self.requests > 0 else 0.0,
+            "connectionsCreated": self.connectionsCreated,
+            "connectionsReused": self.connectionsReused
+        }
+
+    async def close(self):
+        session, self.session = self.session, None
+        if session is not None and not session.closed:
+            await session.close()
+
+
+_shared_pool = None
+
+
+def shared_pool():
+    global _shared_pool
+    if _shared_pool is None:
+        _shared_pool = ConnectionPool()
+    return _shared_pool
+
+
+async def close_shared_pool():
+    if _shared_pool is not None:
+        await _shared_pool.close()
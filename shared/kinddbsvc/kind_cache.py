@@ -0,0 +1,120 @@
+import time
+import logging
+from collections import OrderedDict
+from shared import json_codec
+
+logger = logging.getLogger(__name__)
+
+KIND_CHANGED_TRIGGERS = ("kindAdded", "kindUpdated", "kindDeleted", "fieldsAdded")
+
+
+class KindCache:
+
+    def __init__(self, max_size=256, ttl=300, clock=time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+
+        self.kinds = OrderedDict()
+        self.names = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _expired(self, stored_at):
+        return self.ttl is not None and self.clock() - stored_at > self.ttl
+
+    def _drop(self, kindId):
+        entry = self.kinds.pop(kindId, None)
+        if entry is not None:
+            name = entry[1].get("name")
+            if self.names.get(name) == kindId:
+                del self.names[name]
+        return entry
+
+    def get(self, kindId=None, kindName=None):
+        if kindId is None and kindName is not None:
+            kindId = self.names.get(kindName)
+
+        entry = self.kinds.get(kindId) if kindId is not None else None
+        if entry is None or self._expired(entry[0]):
+            if entry is not None:
+                self._drop(kindId)
+            self.misses += 1
+            return None
+
+        self.kinds.move_to_end(kindId)
+        self.hits += 1
+        return entry[1]
+
+    def get_id(self, kindName):
+        kind = self.get(kindName=kindName)
+        return kind["id"] if kind is not None else None
+
+    def put(self, kind):
+        if kind is None or kind.get("id") is None:
+            return kind
+
+        kindId = kind["id"]
+        self._drop(kindId)
+        self.kinds[kindId] = (self.clock(), kind)
+        if kind.get("name") is not None:
+            self.names[kind["name"]] = kindId
+
+        while len(self.kinds) > self.max_size:
+            oldest = next(iter(self.kinds))
+            self._drop(oldest)
+            self.evictions += 1
+
+        return kind
+
+    def invalidate(self, kindId=None, kindName=None):
+        if kindId is None and kindName is not None:
+            kindId = self.names.pop(kindName, None)
+        if kindId is not None and self._drop(kindId) is not None:
+            self.invalidations += 1
+
+    def clear(self):
+        self.invalidations += len(self.kinds)
+        self.kinds.clear()
+        self.names.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.kinds),
+            "maxSize": self.max_size,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRate": self.hits / lookups if lookups > 0 else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations
+        }
+
+    async def on_kind_changed(self, event):
+        # Events carry the kind either at the top level or wrapped in the
+        # trigger name, e.g. {"kindUpdated": {"id": ..., "name": ...}}.
+        try:
+            parsed = json_codec.loads(event) if isinstance(event, (bytes, str)) else event
+        except ValueError:
+            logger.warning("Clearing kind cache on unparseable kind event")
+            self.clear()
+            return
+
+        candidates = [parsed] + [v for v in parsed.values() if isinstance(v, dict)] \
+            if isinstance(parsed, dict) else []
+        matched = False
+        for c in candidates:
+            kindId = c.get("kindId", c.get("id"))
+            kindName = c.get("kindName", c.get("name"))
+            if kindId is not None or kindName is not None:
+                self.invalidate(kindId=kindId, kindName=kindName)
+                if kindId is not None and kindName is not None:
+                    self.invalidate(kindName=kindName)
+                matched = True
+
+        if not matched:
+            self.clear()
@@ -0,0 +1,86 @@
+import asyncio
+import logging
+from .queries import multiplexed_document, multiplexed_variables, split_multiplexed
+
+logger = logging.getLogger(__name__)
+
+
+# Merges independent root-field operations issued within `window` seconds (or
+# until `maxOperations` are pending) into one aliased GraphQL document, sends
+# a single request and hands each caller the response it would have received
+# on its own.
+class QueryMultiplexer:
+
+    def __init__(self, svc, window=0.002, maxOperations=50):
+        self.svc = svc
+        self.window = window
+        self.maxOperations = maxOperations
+
+        self.pending = []
+        self.timer = None
+        self.tasks = set()
+
+        self.operations = 0
+        self.requests = 0
+
+    def submit(self, operation, variables):
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+        self.pending.append((operation, variables, future))
+        self.operations += 1
+
+        if len(self.pending) >= self.maxOperations:
+            self._start_flush()
+        elif self.timer is None:
+            self.timer = loop.call_later(self.window, self._start_flush)
+        return future
+
+    def _start_flush(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        batch, self.pending = self.pending, []
+        if len(batch) > 0:
+            task = asyncio.ensure_future(self._send(batch))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def _send(self, batch):
+        operations = tuple(op for (op, _, _) in batch)
+        self.requests += 1
+        logger.debug("Multiplexing {} KindDB operations".format(len(batch)))
+        try:
+            # Every mix of operations is a new document, so persisted query
+            # hashes would almost never be known to KindDB: send it in full.
+            out = await self.svc._execute(multiplexed_document(operations),
+                                          multiplexed_variables(self.svc.tenantId, operations,
+                                                                [v for (_, v, _) in batch]), persisted=False)
+            results = split_multiplexed(operations, out)
+        except Exception as e:
+            for (_, _, future) in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, _, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    # Sends the pending operations and waits for the batches already sent, so
+    # no query is in flight when it returns.
+    async def flush(self):
+        batch, self.pending = self.pending, []
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if len(batch) > 0:
+            await self._send(batch)
+        while len(self.tasks) > 0:
+            await asyncio.gather(*list(self.tasks))
+
+    def stats(self):
+        return {
+            "pending": len(self.pending),
+            "operations": self.operations,
+            "requests": self.requests
+        }
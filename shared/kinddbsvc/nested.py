@@ -0,0 +1,121 @@
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _is_list(field):
+    return "LIST" in (field.get("modifiers") or [])
+
+
+def _kind_fields(instance_set):
+    return [(i, f) for (i, f) in enumerate(instance_set["kind"]["schema"])
+            if f["type"] == "KIND" and f.get("typeKindId") is not None]
+
+
+# Replaces KIND references of an allInstances result with the referenced rows.
+# Each distinct referenced kind is fetched once per call (at most `concurrency`
+# at a time) and looked up through an ID index. Expansion stops at `max_depth`
+# and never re-enters a kind already on the current path, so cyclic kinds
+# terminate with the remaining references left as IDs.
+class NestedInstanceResolver:
+
+    def __init__(self, fetch, max_depth=8, concurrency=4):
+        self.fetch = fetch
+        self.max_depth = max_depth
+        self.concurrency = concurrency
+
+        self.sets = {}
+        self.reachable = {}
+        self.resolved = {}
+
+    async def resolve(self, instance_set):
+        root = instance_set["kindId"]
+        self.sets[root] = instance_set
+        await self._fetch_graph(root)
+        self._compute_reachable()
+        records = self._resolve_records(root, frozenset([root]), 0)
+        instance_set["records"] = records
+        return instance_set
+
+    async def _fetch_graph(self, root):
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def fetch_one(kindId):
+            async with semaphore:
+                return kindId, await self.fetch(kindId)
+
+        frontier = {root}
+        for _ in range(self.max_depth):
+            wanted = {f["typeKindId"] for k in frontier if self.sets.get(k) is not None
+                      for (_, f) in _kind_fields(self.sets[k])}
+            todo = [k for k in wanted if k not in self.sets]
+            if len(todo) == 0:
+                break
+            logger.debug("Fetching {} nested kinds".format(len(todo)))
+            for kindId, res in await asyncio.gather(*[fetch_one(k) for k in todo]):
+                self.sets[kindId] = res.get("allInstances") if res is not None else None
+            frontier = set(todo)
+
+    def _compute_reachable(self):
+        edges = {k: {f["typeKindId"] for (_, f) in _kind_fields(s)} if s is not None else set()
+                 for (k, s) in self.sets.items()}
+        for start in edges:
+            seen = set()
+            stack = list(edges[start])
+            while stack:
+                k = stack.pop()
+                if k not in seen:
+                    seen.add(k)
+                    stack.extend(edges.get(k, ()))
+            self.reachable[start] = seen
+
+    def _index(self, kindId, path, depth):
+        # Only the part of the path this kind can reach changes its expansion,
+        # which keeps acyclic (diamond) references sharing one memo entry.
+        key = (kindId, depth, path & self.reachable.get(kindId, frozenset()))
+        index = self.resolved.get(key)
+        if index is None:
+            records = self._resolve_records(kindId, path, depth)
+            index = {r[0]["ID"]: r for r in records}
+            self.resolved[key] = index
+        return index
+
+    def _resolve_records(self, kindId, path, depth):
+        instance_set = self.sets[kindId]
+        records = instance_set["records"]
+        fields = _kind_fields(instance_set)
+        if len(fields) == 0 or depth >= self.max_depth:
+            return records
+
+        lookups = []
+        for (i, f) in fields:
+            nestedId = f["typeKindId"]
+            if nestedId in path or nestedId not in self.sets:
+                continue
+            if self.sets[nestedId] is None:
+                lookups.append((i, f, None))
+            else:
+                lookups.append((i, f, self._index(nestedId, path | {nestedId}, depth + 1)))
+
+        if len(lookups) == 0:
+            return records
+
+        resolved = []
+        for row in records:
+            row = list(row)
+            for (i, f, index) in lookups:
+                value = dict(row[i])
+                if index is None:
+                    value["KIND"] = None
+                elif _is_list(f):
+                    value["l_KIND"] = [index.get(ref, ref) for ref in value.get("l_KIND") or []]
+                elif value.get("KIND") is not None:
+                    ref = value["KIND"]
+                    if ref in index:
+                        value["KIND"] = index[ref]
+                    else:
+                        logger.error("Invalid kind id in KIND field {} for kid: {}".format(f["name"], kindId))
+                row[i] = value
+            resolved.append(row)
+        return resolved
@@ -0,0 +1,314 @@
+import json
+import string
+import hashlib
+from functools import lru_cache
+from collections import namedtuple
+from shared import json_codec
+
+kindDetailsFragment = """
+id
+name
+description
+serviceId
+thumbnailUrl
+nameField
+isPublic
+schema {
+  id
+  name
+  description
+  type
+  typeKindId
+  modifiers
+  kind {
+    id
+    name
+  }
+  hide
+  autoFocus
+  displayAs
+  readonly
+}
+"""
+
+InstanceDetailsFragment = """
+    id
+    kindId
+    kind {
+      schema {
+        id
+        name
+        type
+        modifiers
+        typeKindId
+      }
+    }
+    fieldIds
+    fieldValues {
+      ID
+      STRING
+      INT
+      FLOAT
+      BOOLEAN
+      DATE
+      TIME
+      DATETIME
+      JSON
+      KIND
+      l_ID
+      l_STRING
+      l_INT
+      l_FLOAT
+      l_BOOLEAN
+      l_DATE
+      l_TIME
+      l_DATETIME
+      l_JSON
+      l_KIND
+    }
+"""
+
+InstanceSetDetailsFragment = """
+    kindId
+    kind {
+      schema {
+        id
+        name
+        type
+        modifiers
+        typeKindId
+      }
+    }
+    token
+    fieldIds
+    records {
+      ID
+      STRING
+      INT
+      FLOAT
+      BOOLEAN
+      DATE
+      TIME
+      DATETIME
+      JSON
+      KIND
+      l_ID
+      l_STRING
+      l_INT
+      l_FLOAT
+      l_BOOLEAN
+      l_DATE
+      l_TIME
+      l_DATETIME
+      l_JSON
+      l_KIND
+    }
+  """
+
+LinkDetailsFragment = """
+    id
+    relation {
+      id
+    }
+    fromKind {
+      id
+    }
+    toKind {
+      id
+    }
+    fromInstance {
+      id
+    }
+    toInstance {
+      id
+    }
+    name
+    weight
+    fromOffset
+    fromSpan
+    toOffset
+    toSpan
+"""
+
+
+QueryDocument = namedtuple("QueryDocument", ["name", "text", "sha256", "query", "extensions"])
+
+
+def compile_document(name, template, **fragments):
+    text = " ".join(string.Template(template).safe_substitute(**fragments).split())
+    sha256 = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    extensions = {"persistedQuery": {"version": 1, "sha256Hash": sha256}}
+    return QueryDocument(
+        name=name,
+        text=text,
+        sha256=sha256,
+        query=json.dumps(text).encode("utf-8"),
+        extensions=json.dumps(extensions).encode("utf-8")
+    )
+
+
+def encode_request(document, variables, includeQuery=True, persisted=False):
+    # The document parts are encoded once at import, only the variables are
+    # serialized per call.
+    body = b'{"variables":' + json_codec.dumps(variables)
+    if includeQuery:
+        body += b',"query":' + document.query
+    if persisted:
+        body += b',"extensions":' + document.extensions
+    return body + b'}'
+
+
+KIND_QUERY = compile_document("kind", """
+    query($tenantId: ID!, $kindId: ID, $kindName: String) {
+        kind(tenantId: $tenantId, id: $kindId, name: $kindName) {
+            $kindFragment
+        }
+    }
+""", kindFragment=kindDetailsFragment)
+
+ALL_KINDS_QUERY = compile_document("allKinds", """
+    query($tenantId: ID!) {
+        allKinds(tenantId: $tenantId) {
+            $kindFragment
+        }
+    }
+""", kindFragment=kindDetailsFragment)
+
+INSTANCE_QUERY = compile_document("instance", """
+    query($tenantId: ID!, $instanceRef: InstanceRefInput!) {
+        instance(tenantId: $tenantId, instanceRef: $instanceRef) {
+            $instanceDetailsFragment
+        }
+    }
+""", instanceDetailsFragment=InstanceDetailsFragment)
+
+ADD_RELATION_MUTATION = compile_document("addRelation", """
+    mutation($tenantId: ID!, $addRelationInput: AddRelationInput!) {
+        addRelation(tenantId: $tenantId, input: $addRelationInput)
+    }
+""")
+
+LINK_QUERY = compile_document("link", """
+    query($tenantId: ID!, $id: ID!) {
+        link(tenantId: $tenantId, id: $id) {
+            $linkDetailsFragment
+        }
+    }
+""", linkDetailsFragment=LinkDetailsFragment)
+
+ADD_LINK_MUTATION = compile_document("addLink", """
+    mutation($tenantId: ID!, $addLinkInput: AddLinkInput!) {
+        addLink(tenantId: $tenantId, input: $addLinkInput)
+    }
+""")
+
+ADD_LINKS_MUTATION = compile_document("addLinks", """
+    mutation($tenantId: ID!, $addLinkInputs: [AddLinkInput]!) {
+        addLinks(tenantId: $tenantId, input: $addLinkInputs)
+    }
+""")
+
+ALL_INSTANCES_QUERY = compile_document("allInstances", """
+    query($tenantId: ID!, $kindId: ID, $kindName: String, $take: Int, $token: String) {
+        allInstances(
+            tenantId: $tenantId
+            kindId: $kindId
+            kindName: $kindName
+            take: $take
+            token: $token
+        ) {
+            $InstanceSetDetails
+        }
+    }
+""", InstanceSetDetails=InstanceSetDetailsFragment)
+
+ADD_INSTANCE_MUTATION = compile_document("addInstance", """
+    mutation($tenantId: ID!, $addInstanceInput: AddInstanceInput!) {
+        addInstance(tenantId: $tenantId, input: $addInstanceInput)
+    }
+""")
+
+ADD_INSTANCE_SET_MUTATION = compile_document("addInstanceSet", """
+    mutation($tenantId: ID!, $addInstanceSetInput: AddInstanceSetInput!) {
+        addInstanceSet(tenantId: $tenantId, input: $addInstanceSetInput)
+    }
+""")
+
+ADD_FIELDS_MUTATION = compile_document("addFields", """
+    mutation($tenantId: ID!, $addFieldsInput: AddFieldsInput!) {
+        addFields(tenantId: $tenantId, input: $addFieldsInput)
+    }
+""")
+
+ADD_KIND_MUTATION = compile_document("addKind", """
+    mutation($tenantId: ID!, $addKindInput: AddKindInput!) {
+        addKind(tenantId: $tenantId, input: $addKindInput)
+    }
+""")
+
+
+# A single root field that can be merged with others into one document.
+# `args` holds (argument name, variable name, variable type) triples.
+Operation = namedtuple("Operation", ["field", "args", "selection"])
+
+KIND_OPERATION = Operation("kind", (("id", "kindId", "ID"), ("name", "kindName", "String")), kindDetailsFragment)
+KIND_BY_ID_OPERATION = Operation("kind", (("id", "kindId", "ID"),), kindDetailsFragment)
+INSTANCE_OPERATION = Operation("instance", (("instanceRef", "instanceRef", "InstanceRefInput!"),),
+                               InstanceDetailsFragment)
+LINK_OPERATION = Operation("link", (("id", "id", "ID!"),), LinkDetailsFragment)
+
+
+def operation_alias(index):
+    return "m{}".format(index)
+
+
+def operation_variable(name, index):
+    return "{}_{}".format(name, index)
+
+
+@lru_cache(maxsize=256)
+def multiplexed_document(operations):
+    # Operation i becomes `m<i>: field(tenantId: $tenantId, arg: $var_<i>)`.
+    variables = ["$tenantId: ID!"]
+    fields = []
+    for i, op in enumerate(operations):
+        args = ["tenantId: $tenantId"]
+        for (argName, varName, varType) in op.args:
+            variables.append("${}: {}".format(operation_variable(varName, i), varType))
+            args.append("{}: ${}".format(argName, operation_variable(varName, i)))
+        selection = " {{ {} }}".format(op.selection) if op.selection else ""
+        fields.append("{}: {}({}){}".format(operation_alias(i), op.field, ", ".join(args), selection))
+    name = "+".join(op.field for op in operations)
+    return compile_document(name, "query(" + ", ".join(variables) + ") { " + " ".join(fields) + " }")
+
+
+def multiplexed_variables(tenantId, operations, variables):
+    merged = {"tenantId": tenantId}
+    for i, (op, v) in enumerate(zip(operations, variables)):
+        for (_, varName, _) in op.args:
+            merged[operation_variable(varName, i)] = v.get(varName)
+    return merged
+
+
+def split_multiplexed(operations, out):
+    # Hands every operation the response it would have received on its own:
+    # {"data": {field: value}} plus the errors whose path starts at its alias.
+    shared = []
+    errors = {}
+    for err in out.get("errors") or []:
+        path = err.get("path") if isinstance(err, dict) else None
+        if path:
+            errors.setdefault(path[0], []).append(dict(err, path=path[1:]))
+        else:
+            shared.append(err)
+
+    data = out.get("data") or {}
+    results = []
+    for i, op in enumerate(operations):
+        alias = operation_alias(i)
+        result = {"data": {op.field: data.get(alias)}}
+        opErrors = shared + [dict(e, path=[op.field] + e["path"]) for e in errors.get(alias, [])]
+        if len(opErrors) > 0:
+            result["errors"] = opErrors
+        results.append(result)
+    return results
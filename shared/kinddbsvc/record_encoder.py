@@ -0,0 +1,94 @@
+from functools import lru_cache
+
+FIELD_TYPES = ("ID", "STRING", "INT", "FLOAT", "BOOLEAN", "DATE", "TIME", "DATETIME", "JSON", "KIND")
+
+# (scalar key, list key) of the fieldValues object for every KindDB field type.
+FIELD_VALUE_KEYS = {t: (t, "l_" + t) for t in FIELD_TYPES}
+
+
+def _make_encoder(key):
+    def encode(value):
+        return {key: value}
+    return encode
+
+
+def _encode_unknown(value):
+    return None
+
+
+_ENCODERS = {key: _make_encoder(key) for keys in FIELD_VALUE_KEYS.values() for key in keys}
+
+
+def field_value_key(fType, isList):
+    keys = FIELD_VALUE_KEYS.get(fType)
+    if keys is None:
+        return None
+    return keys[1] if isList else keys[0]
+
+
+def field_encoder(fType, modifiers):
+    key = field_value_key(fType, "LIST" in (modifiers or ()))
+    return _ENCODERS[key] if key is not None else _encode_unknown
+
+
+# Everything that depends on the kind schema is resolved once here, so encoding
+# an instance is a dict lookup and a pre-bound call per field.
+class KindEncoder:
+
+    def __init__(self, kindId, fields):
+        self.kindId = kindId
+
+        self.fields = {}
+        for (fieldId, name, fType, isList) in fields:
+            encoder = _ENCODERS.get(field_value_key(fType, isList), _encode_unknown)
+            self.fields.setdefault(name, (fieldId, encoder))
+
+        self.hasId = any(name == "id" for (_, name, _, _) in fields)
+        self.fieldIds = [fieldId for (fieldId, name, _, _) in fields if name != "id"]
+        self.recordKeys = [(name, field_value_key(fType, isList)) for (_, name, fType, isList) in fields
+                           if name != "id"]
+
+    def encode_instance(self, instance):
+        fields = self.fields
+        fieldIds = []
+        fieldValues = []
+        for k, v in instance.items():
+            field = fields.get(k)
+            if field is None:
+                raise IOError("Field name specified in instance input not found in kind schema.")
+            fieldIds.append(field[0])
+            fieldValues.append(field[1](v))
+
+        return {
+            "kindId": self.kindId,
+            "id": instance["id"],
+            "fieldIds": fieldIds,
+            "fieldValues": fieldValues
+        }
+
+    def encode_instance_set(self, objects):
+        keys = self.recordKeys
+        instanceIds = [obj.get("id") for obj in objects] if self.hasId else []
+        if all(key is not None for (_, key) in keys):
+            records = [[{key: obj.get(name)} for (name, key) in keys] for obj in objects]
+        else:
+            records = [[{key: obj.get(name)} if key is not None else None for (name, key) in keys]
+                       for obj in objects]
+        return list(self.fieldIds), instanceIds, records
+
+
+@lru_cache(maxsize=256)
+def _compile(kindId, fields):
+    return KindEncoder(kindId, fields)
+
+
+def _schema_key(schema):
+    return tuple((f["id"], f["name"], f["type"], "LIST" in (f.get("modifiers") or ())) for f in schema)
+
+
+def encoder_for_schema(schema, kindId=None):
+    return _compile(kindId, _schema_key(schema))
+
+
+def encoder_for_kind(kind):
+    return encoder_for_schema(kind["schema"], kind["id"])
@@ -0,0 +1,89 @@
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from settings import KINDDB_SERVICE_URL, KIND_CACHE_SIZE, KIND_CACHE_TTL, KINDDB_MAX_TENANTS, \
+    KINDDB_TENANT_IDLE_TIMEOUT, KINDDB_TENANT_CONCURRENCY
+from .KindDBSvc import KindDBSvc
+from .kind_cache import KindCache
+from .http_pool import shared_pool
+
+logger = logging.getLogger(__name__)
+
+
+# Hands out tenant-scoped KindDBSvc clients that all share one connection pool.
+# Each tenant has its own bounded kind cache and concurrency limit; the least
+# recently used tenants are evicted past `maxTenants` or after `idleTimeout`
+# seconds without use.
+class KindDBRegistry:
+
+    def __init__(self, pool=None, svcUrl=KINDDB_SERVICE_URL, maxTenants=KINDDB_MAX_TENANTS,
+                 idleTimeout=KINDDB_TENANT_IDLE_TIMEOUT, tenantConcurrency=KINDDB_TENANT_CONCURRENCY,
+                 kindCacheSize=KIND_CACHE_SIZE, kindCacheTtl=KIND_CACHE_TTL, clock=time.monotonic):
+        self.pool = pool if pool is not None else shared_pool()
+        self.svcUrl = svcUrl
+        self.maxTenants = maxTenants
+        self.idleTimeout = idleTimeout
+        self.tenantConcurrency = tenantConcurrency
+        self.kindCacheSize = kindCacheSize
+        self.kindCacheTtl = kindCacheTtl
+        self.clock = clock
+
+        self.clients = OrderedDict()
+        self.created = 0
+        self.evicted = 0
+
+    def __len__(self):
+        return len(self.clients)
+
+    def __contains__(self, tenantId):
+        return tenantId in self.clients
+
+    def _evict(self, tenantId):
+        client, _ = self.clients.pop(tenantId)
+        self.evicted += 1
+        logger.debug("Evicting KindDB client for tenant {}".format(tenantId))
+        # Closing only flushes buffered writes; requests already in flight keep
+        # their reference to the client and complete normally.
+        if client.writeBuffer is not None:
+            asyncio.ensure_future(client.close())
+
+    def _evict_idle(self, now):
+        while len(self.clients) > 0:
+            tenantId, (_, lastUsed) = next(iter(self.clients.items()))
+            if self.idleTimeout is None or now - lastUsed <= self.idleTimeout:
+                break
+            self._evict(tenantId)
+
+    def get(self, tenantId):
+        now = self.clock()
+        self._evict_idle(now)
+
+        entry = self.clients.get(tenantId)
+        if entry is not None:
+            client = entry[0]
+            self.clients.move_to_end(tenantId)
+        else:
+            client = KindDBSvc(tenantId, svcUrl=self.svcUrl, pool=self.pool,
+                               kindCache=KindCache(self.kindCacheSize, self.kindCacheTtl),
+                               concurrency=self.tenantConcurrency)
+            self.created += 1
+        self.clients[tenantId] = (client, now)
+
+        while len(self.clients) > self.maxTenants:
+            self._evict(next(iter(self.clients)))
+        return client
+
+    def stats(self):
+        return {
+            "tenants": len(self.clients),
+            "maxTenants": self.maxTenants,
+            "created": self.created,
+            "evicted": self.evicted,
+            "pool": self.pool.stats()
+        }
+
+    async def close(self):
+        clients = [client for (client, _) in self.clients.values()]
+        self.clients.clear()
+        await asyncio.gather(*[client.close() for client in clients])
@@ -0,0 +1,137 @@
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+# Collects single addInstance / addLink calls for up to `window` seconds or
+# `maxItems` pending writes and sends them as one addInstanceSet per kind and
+# field layout plus one addLinks call. Each caller gets back its own result in
+# the shape the unbuffered call would have returned.
+class WriteBehindBuffer:
+
+    def __init__(self, svc, window=0.05, maxItems=500):
+        self.svc = svc
+        self.window = window
+        self.maxItems = maxItems
+
+        self.instances = []
+        self.links = []
+        self.timer = None
+        self.tasks = set()
+        self.closed = False
+
+        self.flushes = 0
+        self.buffered = 0
+        self.requests = 0
+
+    def __len__(self):
+        return len(self.instances) + len(self.links)
+
+    def _enqueue(self, pending, item):
+        if self.closed:
+            raise RuntimeError("Write-behind buffer is closed")
+        future = asyncio.get_event_loop().create_future()
+        pending.append((item, future))
+        self.buffered += 1
+
+        if len(self) >= self.maxItems:
+            self._start_flush()
+        elif self.timer is None:
+            self.timer = asyncio.get_event_loop().call_later(self.window, self._start_flush)
+        return future
+
+    def addInstance(self, addInstanceInput):
+        return self._enqueue(self.instances, addInstanceInput)
+
+    def addLink(self, addLinkInput):
+        return self._enqueue(self.links, addLinkInput)
+
+    def _start_flush(self):
+        task = asyncio.ensure_future(self._send_pending())
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _send_instances(self, kindId, fieldIds, group):
+        try:
+            out = await self.svc.addInstanceSet({
+                "kindId": kindId,
+                "ids": [i["id"] for (i, _) in group],
+                "fieldIds": list(fieldIds),
+                "records": [i["fieldValues"] for (i, _) in group]
+            })
+            ids = out.get("addInstanceSet") if out is not None else None
+            for n, (item, future) in enumerate(group):
+                if not future.done():
+                    future.set_result({"addInstance": ids[n] if isinstance(ids, list) else item["id"]})
+        except Exception as e:
+            for (_, future) in group:
+                if not future.done():
+                    future.set_exception(e)
+
+    async def _send_links(self, group):
+        try:
+            out = await self.svc.addLinks([l for (l, _) in group])
+            ids = out.get("addLinks") if out is not None else None
+            for n, (item, future) in enumerate(group):
+                if not future.done():
+                    future.set_result({"addLink": ids[n] if isinstance(ids, list) else item.get("id")})
+        except Exception as e:
+            for (_, future) in group:
+                if not future.done():
+                    future.set_exception(e)
+
+    async def _send_pending(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+
+        instances, self.instances = self.instances, []
+        links, self.links = self.links, []
+        if len(instances) == 0 and len(links) == 0:
+            return
+
+        try:
+            groups = {}
+            for (item, future) in instances:
+                try:
+                    key = (item["kindId"], tuple(item["fieldIds"]))
+                except (KeyError, TypeError) as e:
+                    future.set_exception(ValueError("Invalid addInstanceInput: {!r}".format(e)))
+                    continue
+                groups.setdefault(key, []).append((item, future))
+
+            sends = [self._send_instances(kindId, fieldIds, group)
+                     for ((kindId, fieldIds), group) in groups.items()]
+            if len(links) > 0:
+                sends.append(self._send_links(links))
+
+            self.flushes += 1
+            self.requests += len(sends)
+            logger.debug("Flushing {} instances and {} links in {} requests".format(
+                len(instances), len(links), len(sends)))
+            await asyncio.gather(*sends)
+        finally:
+            # No caller may be left waiting, whatever went wrong above.
+            for (_, future) in instances + links:
+                if not future.done():
+                    future.set_exception(RuntimeError("Write-behind flush failed"))
+
+    # Sends what is queued and waits for the sends already started by the
+    # timer or by maxItems, so nothing is in flight when it returns.
+    async def flush(self):
+        await self._send_pending()
+        while len(self.tasks) > 0:
+            await asyncio.gather(*list(self.tasks))
+
+    async def close(self):
+        self.closed = True
+        await self.flush()
+
+    def stats(self):
+        return {
+            "pending": len(self),
+            "buffered": self.buffered,
+            "flushes": self.flushes,
+            "requests": self.requests
+        }
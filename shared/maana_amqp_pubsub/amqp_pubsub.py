@@ -1,61 +1,178 @@
-import sys
 from .subscriber import AMQPSubscriber
+from .publisher import AMQPPublisher
 from .connection_factory import AMQPConnectionFactory
 from .configuration import QueueConfig
+from collections import OrderedDict
+import inspect
 import asyncio
 import logging
+import time
 
 logger = logging.getLogger(__name__)
-logging.basicConfig(stream=sys.stdout, level=logging.DEBUG)
+
+
+class HandlerStats:
+
+    def __init__(self, trigger):
+        self.trigger = trigger
+        self.calls = 0
+        self.errors = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.last_time = 0.0
+
+    def record(self, elapsed, failed):
+        self.calls += 1
+        if failed:
+            self.errors += 1
+        self.total_time += elapsed
+        self.last_time = elapsed
+        self.max_time = max(self.max_time, elapsed)
+
+    def as_dict(self):
+        return {
+            "trigger": self.trigger,
+            "calls": self.calls,
+            "errors": self.errors,
+            "meanLatency": self.total_time / self.calls if self.calls > 0 else 0.0,
+            "maxLatency": self.max_time,
+            "lastLatency": self.last_time
+        }
 
 
 class AmqpPubSub:
 
-    def __init__(self, config, trigger_transform=lambda x: str(x)):
+    def __init__(self, config, trigger_transform=lambda x: str(x), handler_concurrency=16, queue_options=None,
+                 max_in_flight=256, compress_threshold=None, connect_timeout=30.0):
 
         self.trigger_transform = trigger_transform
         self.config = config
+        self.handler_concurrency = handler_concurrency
+        # Keyword arguments for the QueueConfig of every trigger (consumer QoS).
+        self.queue_options = queue_options or {}
 
-        factory = AMQPConnectionFactory(config)
+        self.connection_factory = AMQPConnectionFactory(config, connect_timeout=connect_timeout)
 
-        self.consumer = AMQPSubscriber(factory)
+        self.consumer = AMQPSubscriber(self.connection_factory)
+        self.publisher = AMQPPublisher(self.connection_factory, max_in_flight, compress_threshold)
 
-        self.subscription_map = {}
-        self.subs_ref_map = {}
+        # sub_id -> trigger name, and trigger name -> {sub_id: handler} in
+        # subscription order, so subscribe and unsubscribe are dict operations.
+        self.subscriptions = {}
+        self.handlers = {}
+        self.consumers = {}
+        self.semaphores = {}
+        self.handler_stats = {}
         self.current_sub_id = 0
-        self.unsubscribe_channel = 0
 
     async def subscribe(self, trigger, on_message):
 
         trigger_name = self.trigger_transform(trigger)
         self.current_sub_id = self.current_sub_id + 1
-        self.subscription_map[self.current_sub_id] = [trigger_name, on_message]
-        refs = self.subs_ref_map.get(trigger_name)
-        if refs is not None and len(refs) > 0:
-            self.subs_ref_map[trigger_name] = refs.append(self.current_sub_id)
-        else:
-            disposer = asyncio.ensure_future(self.consumer.subscribe(
-                QueueConfig(trigger_name, self.config.service),
+        sub_id = self.current_sub_id
+
+        handlers = self.handlers.get(trigger_name)
+        if handlers is None:
+            handlers = self.handlers[trigger_name] = OrderedDict()
+            self.consumers[trigger_name] = asyncio.ensure_future(self.consumer.subscribe(
+                QueueConfig(trigger_name, self.config.service, **self.queue_options),
                 lambda msg: self.on_message(trigger_name, msg)
             ))
-            if trigger_name in self.subs_ref_map.keys():
-                self.subs_ref_map[trigger_name] = self.subs_ref_map[trigger_name].append(self.current_sub_id)
-            else:
-                self.subs_ref_map[trigger_name] = [self.current_sub_id]
 
-            self.unsubscribe_channel = disposer
-            return self.current_sub_id
+        handlers[sub_id] = on_message
+        self.subscriptions[sub_id] = trigger_name
+        self.handler_stats[sub_id] = HandlerStats(trigger_name)
 
-    async def on_message(self, channel, message):
-        subscribers = self.subs_ref_map.get(channel)
+        # Wait for the consumer to be set up, so a failure reaches the caller
+        # and the trigger is not left registered against a dead consumer.
+        consumer = self.consumers[trigger_name]
+        try:
+            await asyncio.shield(consumer)
+        except Exception as e:
+            logger.error("Problem subscribing to {}: {}".format(trigger_name, e))
+            await self.unsubscribe(sub_id)
+            raise
+        return sub_id
 
-        if subscribers is None:
-            return None
+    async def unsubscribe(self, sub_id):
+        trigger_name = self.subscriptions.pop(sub_id, None)
+        if trigger_name is None:
+            return False
+        self.handler_stats.pop(sub_id, None)
 
-        for index, elem in enumerate(subscribers):
-            executor = self.subscription_map[index+1]
+        handlers = self.handlers[trigger_name]
+        del handlers[sub_id]
+        if len(handlers) == 0:
+            # The last subscriber of a trigger closes its consumer channel.
+            del self.handlers[trigger_name]
+            self.semaphores.pop(trigger_name, None)
+            consumer = self.consumers.pop(trigger_name)
+            if not consumer.done():
+                # Still waiting for the broker; don't wait for it to come back.
+                consumer.cancel()
+                return True
+            if consumer.cancelled() or consumer.exception() is not None:
+                return True
             try:
-                await executor[1](message)
+                channel = consumer.result()
+                if channel is not None:
+                    await channel.close()
             except Exception as e:
-                logger.error("Problem running handler on event: " + str(e))
-                pass
+                logger.warning("Problem closing consumer for {}: {}".format(trigger_name, e))
+        return True
+
+    def _semaphore(self, trigger_name):
+        semaphore = self.semaphores.get(trigger_name)
+        if semaphore is None:
+            semaphore = self.semaphores[trigger_name] = asyncio.Semaphore(self.handler_concurrency)
+        return semaphore
+
+    async def _run_handler(self, semaphore, sub_id, handler, message):
+        async with semaphore:
+            started = time.monotonic()
+            failed = False
+            try:
+                result = handler(message)
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:
+                failed = True
+                logger.error("Problem running handler {} on event: {}".format(sub_id, e))
+            finally:
+                stats = self.handler_stats.get(sub_id)
+                if stats is not None:
+                    stats.record(time.monotonic() - started, failed)
+            return failed
+
+    async def on_message(self, channel, message):
+        handlers = self.handlers.get(channel)
+
+        if handlers is None:
+            return None
+
+        # Handlers run concurrently, at most handler_concurrency per trigger; a
+        # failing handler does not stop the others, but once they are done the
+        # message fails so that the subscriber retries it.
+        semaphore = self._semaphore(channel)
+        failed = await asyncio.gather(*[self._run_handler(semaphore, sub_id, handler, message)
+                                        for sub_id, handler in list(handlers.items())])
+        if any(failed):
+            raise RuntimeError("{} of {} handlers failed on {}".format(sum(failed), len(failed), channel))
+
+    # Messages may be bytes, str or JSON-serializable objects. compress=True/False
+    # overrides compress_threshold for these messages.
+    async def publish(self, trigger, message, headers=None, compress=None):
+        queue_config = QueueConfig(self.trigger_transform(trigger), self.config.service)
+        await self.publisher.publish(queue_config, message, headers, compress)
+
+    async def publish_many(self, trigger, messages, headers=None, compress=None):
+        queue_config = QueueConfig(self.trigger_transform(trigger), self.config.service)
+        return await self.publisher.publish_many(queue_config, messages, headers, compress)
+
+    async def close(self):
+        for sub_id in list(self.subscriptions):
+            await self.unsubscribe(sub_id)
+        await self.connection_factory.close()
+
+    def stats(self):
+        return {sub_id: stats.as_dict() for sub_id, stats in self.handler_stats.items()}
@@ -1,4 +1,7 @@
 
+import uuid
+
+
 class AmqpConnectionConfig:
 
     def __init__(self, host, port, service=None):
@@ -9,9 +12,40 @@ class AmqpConnectionConfig:
 
 class QueueConfig:
 
-    def __init__(self, queue_name, service_name):
+    def __init__(self, queue_name, service_name, prefetch_count=64, workers=16, ack_batch_size=32,
+                 ack_interval=0.1, max_retries=5, retry_backoff=0.5, max_retry_backoff=30.0, dead_letter=True,
+                 exclusive=False):
         self.publish_exchange = queue_name + ".Exchange.fanout"
-        if service_name is not None:
+        # An exclusive queue belongs to this connection only and is deleted with
+        # it, so the consumer gets its own copy of every event instead of sharing
+        # the service's queue with the other consumers.
+        self.exclusive = exclusive
+        if exclusive:
+            self.subscribe_queue = "{}.{}.{}.Fanout".format(queue_name, service_name or "", uuid.uuid4().hex)
+        elif service_name is not None:
             self.subscribe_queue = queue_name + "." + service_name + ".Queue"
         else:
             self.subscribe_queue = queue_name + ".Queue"
+
+        # Consumer QoS: at most prefetch_count unacknowledged messages are
+        # delivered, at most `workers` of them are processed at once, and
+        # completed messages are acknowledged together once ack_batch_size are
+        # done or ack_interval seconds have passed.
+        self.prefetch_count = prefetch_count
+        self.workers = workers
+        self.ack_batch_size = ack_batch_size
+        self.ack_interval = ack_interval
+
+        # A failed message waits out an exponential backoff in the delay queue
+        # of its attempt, whose expired messages go back to the subscribe queue,
+        # and goes to the dead letter queue after max_retries attempts.
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.max_retry_backoff = max_retry_backoff
+        self.dead_letter_queue = self.subscribe_queue + ".DeadLetter" if dead_letter and not exclusive else None
+
+    def retry_delay(self, attempt):
+        return min(self.retry_backoff * 2 ** (attempt - 1), self.max_retry_backoff)
+
+    def retry_queue(self, attempt):
+        return "{}.Retry.{}".format(self.subscribe_queue, attempt)
@@ -1,21 +1,133 @@
 from .configuration import AmqpConnectionConfig
-from aio_pika import connect
-import sys
+from aio_pika import connect_robust
+from aio_pika.pool import Pool
+from aio_pika.robust_connection import RobustConnection
+import asyncio
 import logging
+import random
 
 logger = logging.getLogger(__name__)
-logging.basicConfig(stream=sys.stdout, level=logging.DEBUG)
+
+
+# RobustConnection reconnects (and restores channels, QoS, exchanges, queues,
+# bindings and consumers) every `reconnect_interval` seconds. This variant
+# spreads reconnects of many processes with a full-jitter exponential backoff,
+# for the initial connect as well as after the connection is lost.
+class BackoffRobustConnection(RobustConnection):
+
+    def __init__(self, *args, max_reconnect_interval=30.0, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.base_reconnect_interval = self.reconnect_interval
+        self.max_reconnect_interval = max_reconnect_interval
+        self.reconnect_attempts = 0
+
+    def _on_connection_open(self, future, connection):
+        self.reconnect_attempts = 0
+        super()._on_connection_open(future, connection)
+
+    def _on_connection_lost(self, future, connection, code, reason):
+        self.reconnect_attempts += 1
+        cap = min(self.max_reconnect_interval,
+                  self.base_reconnect_interval * 2 ** min(self.reconnect_attempts - 1, 16))
+        self.reconnect_interval = random.uniform(0, cap)
+        if not self._closed:
+            logger.warning("AMQP connection lost ({}), reconnecting in {:.1f}s".format(
+                reason, self.reconnect_interval))
+        super()._on_connection_lost(future, connection, code, reason)
+
+
+# (url, loop) -> future of the shared connection, the number of factories
+# using it, and its channel pool.
+_connections = {}
+_references = {}
+_channel_pools = {}
 
 
 class AMQPConnectionFactory:
 
-    def __init__(self, config: AmqpConnectionConfig):
+    def __init__(self, config: AmqpConnectionConfig, reconnect_interval=0.5, max_reconnect_interval=30.0,
+                 connect_timeout=30.0, channel_pool_size=8):
         self.connection = "amqp://{host}:{port}".format(host=config.host, port=config.port)
+        self.reconnect_interval = reconnect_interval
+        self.max_reconnect_interval = max_reconnect_interval
+        self.connect_timeout = connect_timeout
+        self.channel_pool_size = channel_pool_size
+        self.keys = set()
+
+    def _key(self):
+        return self.connection, asyncio.get_event_loop()
 
+    async def _connect(self):
+        return await connect_robust(self.connection, connection_class=BackoffRobustConnection,
+                                    reconnect_interval=self.reconnect_interval,
+                                    max_reconnect_interval=self.max_reconnect_interval)
+
+    # Every factory for the same broker shares one robust connection per
+    # process (and event loop), which is closed when the last of them closes.
+    # Raises when the connection cannot be made within connect_timeout seconds.
     async def create(self):
+        key = self._key()
+        self._reference(key)
+        return await self._connection(key)
+
+    def _reference(self, key):
+        if key not in self.keys:
+            self.keys.add(key)
+            _references[key] = _references.get(key, 0) + 1
+
+    async def _connection(self, key):
+        future = _connections.get(key)
+        # A connection that is reconnecting reports is_closed too; only one
+        # that was closed for good is replaced.
+        if future is None or (future.done() and (future.cancelled() or future.exception() is not None or
+                                                   future.result()._closed)):
+            future = _connections[key] = asyncio.ensure_future(self._connect())
         try:
-            connection = await connect(self.connection)
-            return connection
+            return await asyncio.wait_for(asyncio.shield(future), self.connect_timeout)
         except Exception as e:
-            logger.warning(e)
-            pass
+            if isinstance(e, asyncio.TimeoutError):
+                e = ConnectionError("Could not connect to {} within {}s".format(self.connection, self.connect_timeout))
+            logger.error("AMQP connection to {} failed: {}".format(self.connection, e))
+            if future.done() and _connections.get(key) is future:
+                del _connections[key]
+            raise e
+
+    async def channel(self):
+        connection = await self.create()
+        return await connection.channel()
+
+    # At most channel_pool_size reusable channels on the shared connection for
+    # short operations such as a batch of publishes; use as
+    # `async with factory.channel_pool().acquire() as channel:`.
+    def channel_pool(self):
+        key = self._key()
+        self._reference(key)
+        pool = _channel_pools.get(key)
+        if pool is None:
+            async def open_channel():
+                # Not through create(): the pool outlives the factory that made it.
+                return await (await self._connection(key)).channel()
+
+            pool = _channel_pools[key] = Pool(open_channel, max_size=self.channel_pool_size)
+        return pool
+
+    async def close(self):
+        key = self._key()
+        if key not in self.keys:
+            return
+        self.keys.discard(key)
+        _references[key] -= 1
+        if _references[key] > 0:
+            return
+        del _references[key]
+        # Pooled channels are closed with the connection.
+        _channel_pools.pop(key, None)
+        future = _connections.pop(key, None)
+        if future is None:
+            return
+        if not future.done():
+            # Still connecting (the broker may be down): give up instead of
+            # waiting for it.
+            future.cancel()
+        elif not future.cancelled() and future.exception() is None:
+            await future.result().close()
@@ -0,0 +1,172 @@
+from aio_pika import ExchangeType, Message, DeliveryMode
+from shared import json_codec
+import asyncio
+import logging
+import zlib
+
+logger = logging.getLogger(__name__)
+
+DEFLATE = "deflate"
+
+
+class PublishError(Exception):
+
+    def __init__(self, failures, total):
+        super().__init__("{} of {} messages were not confirmed: {}".format(len(failures), total, failures[0]))
+        self.failures = failures
+        self.total = total
+
+
+def encode_body(body):
+    if isinstance(body, bytes):
+        return body, None
+    if isinstance(body, str):
+        return body.encode("utf-8"), "text/plain"
+    return json_codec.dumps(body), "application/json"
+
+
+def decode_body(message):
+    if message.content_encoding == DEFLATE:
+        return zlib.decompress(message.body)
+    return message.body
+
+
+# Publishes to the fanout exchange of a trigger with publisher confirms: single
+# messages on the publisher's own channel, and every publish_many() batch on a
+# channel from the connection factory's pool, so concurrent batches do not share
+# one channel. Every exchange.publish() waits for its broker confirm, so publishes
+# are pipelined: up to max_in_flight messages are written before their confirms
+# arrive (the broker confirms many at once), and publishing waits for a free
+# slot when the window is full. Bodies of at least compress_threshold bytes are
+# deflated and marked with content_encoding so subscribers can inflate them.
+class AMQPPublisher:
+
+    def __init__(self, connection_factory, max_in_flight=256, compress_threshold=None, compress_level=6):
+        self.connection_factory = connection_factory
+        self.max_in_flight = max_in_flight
+        self.compress_threshold = compress_threshold
+        self.compress_level = compress_level
+
+        self.window = None
+        self.lock = None
+        self.channel = None
+        self.exchanges = {}
+        self.pooled_exchanges = {}
+
+        self.published = 0
+        self.confirmed = 0
+        self.failed = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.bytes = 0
+        self.compressed_bytes = 0
+
+    async def _exchange(self, queue_config):
+        name = queue_config.publish_exchange
+        exchange = self.exchanges.get(name)
+        if exchange is not None:
+            return exchange
+
+        # Concurrent first publishes share one channel and one declaration.
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+        async with self.lock:
+            exchange = self.exchanges.get(name)
+            if exchange is None:
+                if self.channel is None or self.channel.is_closed:
+                    self.channel = await self.connection_factory.channel()
+                    self.exchanges.clear()
+                exchange = await self.channel.declare_exchange(type=ExchangeType.FANOUT, name=name, durable=True)
+                self.exchanges[name] = exchange
+        return exchange
+
+    async def _pooled_exchange(self, channel, queue_config):
+        # A pooled channel is only used by the batch holding it.
+        key = (channel, queue_config.publish_exchange)
+        exchange = self.pooled_exchanges.get(key)
+        if exchange is None:
+            exchange = await channel.declare_exchange(type=ExchangeType.FANOUT, name=key[1], durable=True)
+            self.pooled_exchanges[key] = exchange
+        return exchange
+
+    def _message(self, body, headers, compress):
+        body, content_type = encode_body(body)
+        content_encoding = None
+        self.bytes += len(body)
+        if compress is None:
+            compress = self.compress_threshold is not None and len(body) >= self.compress_threshold
+        if compress:
+            body = zlib.compress(body, self.compress_level)
+            content_encoding = DEFLATE
+        self.compressed_bytes += len(body)
+        return Message(body, headers=headers, content_type=content_type, content_encoding=content_encoding,
+                       delivery_mode=DeliveryMode.PERSISTENT)
+
+    async def _acquire(self):
+        if self.window is None:
+            self.window = asyncio.Semaphore(self.max_in_flight)
+        await self.window.acquire()
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    async def _send(self, exchange, message):
+        try:
+            await exchange.publish(message, routing_key="")
+            self.confirmed += 1
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.in_flight -= 1
+            self.window.release()
+
+    async def publish(self, queue_config, body, headers=None, compress=None):
+        exchange = await self._exchange(queue_config)
+        # Encoding may fail, so the message is built before taking a slot.
+        message = self._message(body, headers, compress)
+        await self._acquire()
+        self.published += 1
+        await self._send(exchange, message)
+
+    async def publish_many(self, queue_config, bodies, headers=None, compress=None):
+        async with self.connection_factory.channel_pool().acquire() as channel:
+            exchange = await self._pooled_exchange(channel, queue_config)
+            return await self._publish_all(exchange, bodies, headers, compress)
+
+    async def _publish_all(self, exchange, bodies, headers, compress):
+        pending = set()
+        failures = []
+        total = 0
+
+        def on_done(task):
+            pending.discard(task)
+            if not task.cancelled() and task.exception() is not None:
+                failures.append(task.exception())
+
+        # Only max_in_flight sends exist at a time, so any iterable of bodies
+        # can be published without buffering it.
+        for body in bodies:
+            message = self._message(body, headers, compress)
+            await self._acquire()
+            self.published += 1
+            total += 1
+            task = asyncio.ensure_future(self._send(exchange, message))
+            task.add_done_callback(on_done)
+            pending.add(task)
+
+        if len(pending) > 0:
+            await asyncio.wait(list(pending))
+        if len(failures) > 0:
+            raise PublishError(failures, total)
+        return total
+
+    def stats(self):
+        return {
+            "published": self.published,
+            "confirmed": self.confirmed,
+            "failed": self.failed,
+            "inFlight": self.in_flight,
+            "peakInFlight": self.peak_in_flight,
+            "bytes": self.bytes,
+            "compressedBytes": self.compressed_bytes
+        }
@@ -1,10 +1,88 @@
-from aio_pika import ExchangeType
-import sys
+from aio_pika import ExchangeType, Message
+from collections import OrderedDict
+from .publisher import decode_body
 import asyncio
 import logging
 
 logger = logging.getLogger(__name__)
-logging.basicConfig(stream=sys.stdout, level=logging.DEBUG)
+
+RETRY_HEADER = "x-retry-count"
+
+
+# Acknowledges completed messages in batches. Delivery tags grow with every
+# delivery on a channel, and a multiple ack covers every unacknowledged tag up
+# to the given one, so the contiguous prefix of completed deliveries is
+# acknowledged with one multiple ack. Completions behind a message that is still
+# in progress are acknowledged one by one, so a slow message does not hold the
+# prefetch window; they stay tracked (as settled) until the prefix reaches them.
+class BatchAcker:
+
+    def __init__(self, batch_size, interval):
+        self.batch_size = batch_size
+        self.interval = interval
+        self.pending = OrderedDict()
+        self.completed = 0
+        self.timer = None
+
+        self.acks = 0
+        self.acked_messages = 0
+
+    def track(self, message):
+        tag = message.delivery_tag
+        if len(self.pending) > 0 and tag <= next(reversed(self.pending)):
+            # Delivery tags restart when the channel is reopened after a
+            # reconnect; the old channel's deliveries will be redelivered.
+            self.pending.clear()
+            self.completed = 0
+        self.pending[tag] = [message, False, False]
+
+    def done(self, message, settled=False):
+        entry = self.pending.get(message.delivery_tag)
+        if entry is None or entry[0] is not message:
+            return
+        entry[1] = True
+        entry[2] = settled
+        if settled:
+            return
+        self.completed += 1
+        if self.completed >= self.batch_size:
+            self.flush()
+        elif self.timer is None:
+            self.timer = asyncio.get_event_loop().call_later(self.interval, self.flush)
+
+    def _ack(self, message, multiple, count):
+        try:
+            message.ack(multiple=multiple)
+            self.acks += 1
+            self.acked_messages += count
+        except Exception as e:
+            logger.error("Problem acknowledging messages: {}".format(e))
+
+    def flush(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+
+        last = None
+        count = 0
+        blocked = False
+        for tag, entry in list(self.pending.items()):
+            message, completed, settled = entry
+            if not completed:
+                blocked = True
+            elif not blocked:
+                del self.pending[tag]
+                if not settled:
+                    last = message
+                    count += 1
+            elif not settled:
+                entry[2] = True
+                self._ack(message, False, 1)
+        self.completed = 0
+
+        if last is not None:
+            self._ack(last, True, count)
+
 
 class AMQPSubscriber:
 
@@ -12,32 +90,82 @@ class AMQPSubscriber:
         self.connection_factory = connection_factory
 
     async def subscribe(self, queue_config, action):
-        connection = await self.connection_factory.create()
-        channel = await connection.channel()
+        # Every subscription gets its own channel on the shared connection.
+        channel = await self.connection_factory.channel()
+        await channel.set_qos(prefetch_count=queue_config.prefetch_count)
         queue = await self.setup_channel(channel, queue_config)
-        asyncio.ensure_future(self.subscribe_to_channel(queue, queue_config, action))
+        await self.subscribe_to_channel(queue, queue_config, action, channel)
         return channel
 
-    async def subscribe_to_channel(self, channel, queue_config, action):
+    async def subscribe_to_channel(self, queue, queue_config, action, channel):
+        workers = asyncio.Semaphore(queue_config.workers)
+        acker = BatchAcker(queue_config.ack_batch_size, queue_config.ack_interval)
+
         async def callback(message):
-            logger.debug(message.body)
-            try:
-                await action(message.body)
-                message.ack()
-                return message.body
-            except:
-                message.nack()
-                return None
-
-        back = await channel.consume(callback)
+            acker.track(message)
+            async with workers:
+                logger.debug(message.body)
+                try:
+                    await action(decode_body(message))
+                except Exception as e:
+                    logger.warning("Problem handling message from {}: {}".format(queue_config.subscribe_queue, e))
+                    await self.retry(channel, queue_config, message, acker)
+                    return None
+            acker.done(message)
+            return message.body
+
+        back = await queue.consume(callback)
         return back
 
+    async def retry(self, channel, queue_config, message, acker):
+        headers = dict(message.headers or {})
+        attempts = int(headers.get(RETRY_HEADER, 0)) + 1
+
+        # The copy waits in a delay queue instead of here, so the original is
+        # acknowledged as soon as the copy is confirmed.
+        if attempts <= queue_config.max_retries:
+            routing_key = queue_config.retry_queue(attempts)
+        elif queue_config.dead_letter_queue is not None:
+            routing_key = queue_config.dead_letter_queue
+            logger.error("Moving message to {} after {} attempts".format(routing_key, attempts - 1))
+        else:
+            logger.error("Dropping message from {} after {} attempts".format(queue_config.subscribe_queue,
+                                                                            attempts - 1))
+            acker.done(message)
+            return
+
+        headers[RETRY_HEADER] = attempts
+        try:
+            await channel.default_exchange.publish(
+                Message(message.body, headers=headers, content_type=message.content_type,
+                        content_encoding=message.content_encoding, delivery_mode=message.delivery_mode),
+                routing_key=routing_key)
+            acker.done(message)
+        except Exception as e:
+            logger.error("Problem republishing message to {}: {}".format(routing_key, e))
+            try:
+                message.nack(requeue=True)
+            except Exception:
+                pass
+            acker.done(message, settled=True)
+
     async def setup_channel(self, channel, queue_config):
         try:
             exchange = await channel.declare_exchange(type=ExchangeType.FANOUT, name=queue_config.publish_exchange, durable=True)
-            queue = await channel.declare_queue(queue_config.subscribe_queue)
+            queue = await channel.declare_queue(queue_config.subscribe_queue, exclusive=queue_config.exclusive,
+                                                auto_delete=queue_config.exclusive)
             await queue.bind(exchange, "")
+            for attempt in range(1, queue_config.max_retries + 1):
+                await channel.declare_queue(queue_config.retry_queue(attempt), durable=not queue_config.exclusive,
+                                            exclusive=queue_config.exclusive, arguments={
+                                                "x-message-ttl": int(queue_config.retry_delay(attempt) * 1000),
+                                                "x-dead-letter-exchange": "",
+                                                "x-dead-letter-routing-key": queue_config.subscribe_queue
+                                            })
+            if queue_config.dead_letter_queue is not None:
+                await channel.declare_queue(queue_config.dead_letter_queue, durable=True)
             return queue
         except Exception as e:
-            logger.error(e)
-            sys.exit(-1)
+            logger.error("Problem setting up {}: {}".format(queue_config.subscribe_queue, e))
+            await channel.close()
+            raise
@@ -30,6 +30,17 @@ class TestE2E(unittest.TestCase):
         observed = run_query(query)
         assert observed == result
 
+    def test_batched_operations(self):
+        request = requests.post(URL, json=[
+            {'query': '''{ info { id } }'''},
+            {'query': '''{ info { srl } }'''}
+        ])
+        assert request.status_code == 200
+        assert request.json() == [
+            {"data": {"info": {"id": "io.maana.pytemplate"}}},
+            {"data": {"info": {"srl": 1}}}
+        ]
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,89 @@
+import asyncio
+import unittest
+from shared import json_codec
+from shared.kinddbsvc.bulk import BulkWriter, chunk_records
+
+
+def run(coroutine):
+    return asyncio.get_event_loop().run_until_complete(coroutine)
+
+
+# Records every addInstanceSet input; chunks listed in `failures` raise that
+# many times before they succeed.
+class FakeSend:
+
+    def __init__(self, failures=None):
+        self.failures = dict(failures or {})
+        self.calls = []
+
+    async def __call__(self, addInstanceSetInput):
+        first = addInstanceSetInput["ids"][0]
+        self.calls.append(first)
+        if self.failures.get(first, 0) > 0:
+            self.failures[first] -= 1
+            raise RuntimeError("KindDB unavailable")
+        return {"addInstanceSet": addInstanceSetInput["ids"]}
+
+
+def rows(n):
+    return ["i{}".format(i) for i in range(n)], [[i] for i in range(n)]
+
+
+class TestChunkRecords(unittest.TestCase):
+
+    def test_chunks_are_cut_at_max_records(self):
+        ids, records = rows(5)
+        chunks = list(chunk_records(ids, records, 2, 1 << 20))
+        self.assertEqual([0, 2, 4], [offset for (offset, _, _, _) in chunks])
+        self.assertEqual([["i0", "i1"], ["i2", "i3"], ["i4"]], [c for (_, c, _, _) in chunks])
+
+    def test_chunks_are_cut_at_max_bytes(self):
+        ids, records = ["a", "b", "c"], [["x" * 10], ["y" * 10], ["z" * 10]]
+        recordSize = len(json_codec.dumps(records[0])) + len(json_codec.dumps(ids[0])) + 2
+        chunks = list(chunk_records(ids, records, 100, 2 * recordSize))
+        self.assertEqual([["a", "b"], ["c"]], [c for (_, c, _, _) in chunks])
+        self.assertEqual(2 * recordSize, chunks[0][3])
+
+    def test_oversized_record_gets_its_own_chunk(self):
+        ids, records = ["a", "b"], [["x" * 100], ["y"]]
+        chunks = list(chunk_records(ids, records, 100, 10))
+        self.assertEqual([["a"], ["b"]], [c for (_, c, _, _) in chunks])
+
+
+class TestBulkWriter(unittest.TestCase):
+
+    def test_writes_every_chunk_in_order(self):
+        send = FakeSend()
+        ids, records = rows(7)
+        result = run(BulkWriter(send, batchSize=3, concurrency=2).write("k1", ["f1"], ids, records))
+
+        self.assertTrue(result.ok)
+        self.assertEqual(7, result.written)
+        self.assertEqual(ids, result.ids)
+        self.assertEqual([0, 1, 2], [c.index for c in result.chunks])
+        self.assertEqual(["i0", "i3", "i6"], sorted(send.calls))
+
+    def test_failed_chunk_is_retried(self):
+        send = FakeSend(failures={"i2": 2})
+        ids, records = rows(4)
+        result = run(BulkWriter(send, batchSize=2, retries=3, backoff=0).write("k1", ["f1"], ids, records))
+
+        self.assertTrue(result.ok)
+        self.assertEqual([1, 3], [c.attempts for c in result.chunks])
+        self.assertEqual(4, result.written)
+
+    def test_chunk_fails_after_retries_without_failing_the_rest(self):
+        send = FakeSend(failures={"i0": 10})
+        ids, records = rows(4)
+        result = run(BulkWriter(send, batchSize=2, retries=1, backoff=0).write("k1", ["f1"], ids, records))
+
+        self.assertFalse(result.ok)
+        self.assertEqual(2, result.written)
+        self.assertEqual([0], [c.index for c in result.failed])
+        self.assertEqual(2, result.failed[0].attempts)
+        self.assertEqual(["i2", "i3"], result.ids)
+        self.assertEqual(2, result.to_dict()["failed"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+import asyncio
+import unittest
+from shared import json_codec
+from shared.kinddbsvc.dataloader import DataLoader, KindDBLoaders
+from shared.kinddbsvc.KindDBSvc import KindDBSvc
+
+
+def run(coroutine):
+    return asyncio.get_event_loop().run_until_complete(coroutine)
+
+
+# Answers every multiplexed `kind` operation `m<i>` with the kind it asked for.
+class FakePool:
+
+    def __init__(self):
+        self.requests = []
+
+    async def post(self, url, data, headers):
+        request = json_codec.loads(data)
+        self.requests.append(request)
+        variables = request["variables"]
+        data = {}
+        for name, value in variables.items():
+            if name.startswith("kindId_"):
+                data["m" + name[len("kindId_"):]] = {"id": value, "name": "Kind " + value, "schema": []}
+        return json_codec.dumps({"data": data})
+
+
+class TestDataLoader(unittest.TestCase):
+
+    def test_loads_in_one_tick_become_one_batch(self):
+        batches = []
+
+        async def batchFn(keys):
+            batches.append(keys)
+            return [key * 2 for key in keys]
+
+        async def main():
+            loader = DataLoader(batchFn)
+            return await asyncio.gather(*[loader.load(n) for n in [1, 2, 3, 2]])
+
+        self.assertEqual([2, 4, 6, 4], run(main()))
+        self.assertEqual([[1, 2, 3]], batches)
+
+    def test_batches_are_split_by_max_batch_size(self):
+        batches = []
+
+        async def batchFn(keys):
+            batches.append(keys)
+            return keys
+
+        async def main():
+            loader = DataLoader(batchFn, maxBatchSize=2)
+            return await loader.load_many([1, 2, 3])
+
+        self.assertEqual([1, 2, 3], run(main()))
+        self.assertEqual([[1, 2], [3]], batches)
+
+    def test_exception_value_rejects_only_its_key_and_is_not_cached(self):
+        calls = []
+
+        async def batchFn(keys):
+            calls.append(keys)
+            return [KeyError(key) if key == "bad" else key for key in keys]
+
+        async def main():
+            loader = DataLoader(batchFn)
+            good, bad = await asyncio.gather(loader.load("good"), loader.load("bad"), return_exceptions=True)
+            self.assertEqual("good", good)
+            self.assertIsInstance(bad, KeyError)
+            await asyncio.gather(loader.load("good"), loader.load("bad"), return_exceptions=True)
+
+        run(main())
+        self.assertEqual([["good", "bad"], ["bad"]], calls)
+
+
+class TestKindDBLoaders(unittest.TestCase):
+
+    def test_n_kind_loads_send_one_kinddb_request(self):
+        pool = FakePool()
+        loaders = KindDBLoaders(
+            lambda: KindDBSvc("tenant", svcUrl="http://kinddb/graphql", pool=pool, persistedQueries=False))
+
+        async def main():
+            return await asyncio.gather(*[loaders.kind.load("k{}".format(n)) for n in range(5)])
+
+        kinds = run(main())
+        self.assertEqual(["k0", "k1", "k2", "k3", "k4"], [k["id"] for k in kinds])
+        self.assertEqual(1, len(pool.requests))
+        self.assertEqual(1, loaders.kind.batches)
+
+    def test_instance_keys_become_instance_refs(self):
+        refs = []
+
+        class FakeClient:
+            async def getInstances(self, instanceRefs):
+                refs.append(instanceRefs)
+                return [{"id": ref["id"], "kindId": ref["kindId"]} for ref in instanceRefs]
+
+        loaders = KindDBLoaders(FakeClient)
+
+        async def main():
+            return await asyncio.gather(loaders.instance.load(("k1", None, "i1")),
+                                        loaders.instance.load(("k1", None, "i2")))
+
+        self.assertEqual(["i1", "i2"], [i["id"] for i in run(main())])
+        self.assertEqual([[{"kindId": "k1", "kindName": None, "id": "i1"},
+                           {"kindId": "k1", "kindName": None, "id": "i2"}]], refs)
+
+
+if __name__ == '__main__':
+    unittest.main()
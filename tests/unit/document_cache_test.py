@@ -0,0 +1,66 @@
+import unittest
+from graphql import GraphQLSchema, GraphQLObjectType, GraphQLField, GraphQLString, graphql
+from shared.graphql_server.document_cache import CachedDocumentBackend
+
+
+def make_schema():
+    return GraphQLSchema(query=GraphQLObjectType("Query", {
+        "hello": GraphQLField(GraphQLString, resolver=lambda *_: "world"),
+        "bye": GraphQLField(GraphQLString, resolver=lambda *_: "moon")
+    }))
+
+
+class TestCachedDocumentBackend(unittest.TestCase):
+
+    def test_repeated_query_is_parsed_once(self):
+        schema = make_schema()
+        backend = CachedDocumentBackend()
+        first = backend.document_from_string(schema, "{ hello }")
+        second = backend.document_from_string(schema, "{ hello }")
+
+        self.assertIs(first, second)
+        self.assertEqual({"hello": "world"}, graphql(schema, "{ hello }", backend=backend).data)
+        self.assertEqual(2, backend.stats()["hits"])
+        self.assertEqual(1, backend.stats()["misses"])
+
+    def test_least_recently_used_document_is_evicted(self):
+        schema = make_schema()
+        backend = CachedDocumentBackend(maxSize=2)
+        hello = backend.document_from_string(schema, "{ hello }")
+        backend.document_from_string(schema, "{ bye }")
+        backend.document_from_string(schema, "{ hello }")
+        backend.document_from_string(schema, "{ hello bye }")
+
+        self.assertIs(hello, backend.document_from_string(schema, "{ hello }"))
+        backend.document_from_string(schema, "{ bye }")
+        self.assertEqual(4, backend.stats()["misses"])
+        self.assertEqual(2, backend.stats()["evictions"])
+
+    def test_invalid_query_is_cached_with_its_errors(self):
+        schema = make_schema()
+        backend = CachedDocumentBackend()
+        for _ in range(2):
+            result = graphql(schema, "{ nope }", backend=backend)
+            self.assertTrue(result.invalid)
+            self.assertEqual(1, len(result.errors))
+        self.assertEqual(1, backend.stats()["misses"])
+
+    def test_new_schema_clears_the_cache(self):
+        backend = CachedDocumentBackend()
+        backend.document_from_string(make_schema(), "{ hello }")
+        backend.document_from_string(make_schema(), "{ hello }")
+
+        self.assertEqual(0, backend.stats()["hits"])
+        self.assertEqual(1, backend.stats()["size"])
+
+    def test_disabled_cache_falls_back_to_core_backend(self):
+        schema = make_schema()
+        backend = CachedDocumentBackend(maxSize=0)
+        backend.document_from_string(schema, "{ hello }")
+
+        self.assertEqual(0, backend.stats()["size"])
+        self.assertEqual(0, backend.stats()["misses"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import asyncio
+import unittest
+from shared import json_codec
+from shared.kinddbsvc.kind_cache import KindCache
+from shared.kinddbsvc.KindDBSvc import KindDBSvc
+
+
+def run(coroutine):
+    return asyncio.get_event_loop().run_until_complete(coroutine)
+
+
+class Clock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def kind(kindId, name):
+    return {"id": kindId, "name": name, "schema": []}
+
+
+class FakePool:
+
+    def __init__(self):
+        self.requests = []
+
+    async def post(self, url, data, headers):
+        self.requests.append(json_codec.loads(data))
+        await asyncio.sleep(0.01)
+        variables = self.requests[-1]["variables"]
+        return json_codec.dumps({"data": {"kind": kind("k1", variables["kindName"])}})
+
+
+class TestKindCache(unittest.TestCase):
+
+    def test_entries_expire_after_ttl(self):
+        clock = Clock()
+        cache = KindCache(max_size=4, ttl=10, clock=clock)
+        cache.put(kind("k1", "Person"))
+        clock.now = 10
+        self.assertEqual("k1", cache.get(kindName="Person")["id"])
+        clock.now = 10.5
+        self.assertIsNone(cache.get(kindId="k1"))
+        self.assertIsNone(cache.get(kindName="Person"))
+        self.assertEqual(0, cache.stats()["size"])
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = KindCache(max_size=2, ttl=None)
+        cache.put(kind("k1", "A"))
+        cache.put(kind("k2", "B"))
+        cache.get(kindId="k1")
+        cache.put(kind("k3", "C"))
+        self.assertIsNone(cache.get(kindName="B"))
+        self.assertIsNotNone(cache.get(kindId="k1"))
+        self.assertIsNotNone(cache.get(kindId="k3"))
+        self.assertEqual(1, cache.stats()["evictions"])
+
+    def test_invalidation_by_id_name_and_event(self):
+        cache = KindCache(ttl=None)
+        cache.put(kind("k1", "A"))
+        cache.put(kind("k2", "B"))
+        cache.put(kind("k3", "C"))
+        cache.invalidate(kindName="A")
+        cache.invalidate(kindId="k2")
+        self.assertIsNone(cache.get(kindId="k1"))
+        self.assertIsNone(cache.get(kindName="B"))
+
+        run(cache.on_kind_changed(b'{"kindUpdated": {"id": "k3", "name": "C"}}'))
+        self.assertIsNone(cache.get(kindId="k3"))
+        cache.put(kind("k4", "D"))
+        run(cache.on_kind_changed(b'not json'))
+        self.assertEqual(0, cache.stats()["size"])
+
+
+class TestGetKind(unittest.TestCase):
+
+    def test_concurrent_misses_share_one_query(self):
+        async def scenario():
+            pool = FakePool()
+            svc = KindDBSvc("tenant", svcUrl="http://kinddb/graphql", pool=pool, persistedQueries=False)
+            results = await asyncio.gather(*[svc.getKind(None, "Person") for _ in range(5)])
+            self.assertEqual(1, len(pool.requests))
+            self.assertEqual(["k1"] * 5, [r["kind"]["id"] for r in results])
+
+            await svc.getKind(None, "Person")
+            self.assertEqual(1, len(pool.requests))
+            self.assertEqual({}, svc.kindQueries)
+
+        run(scenario())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import asyncio
+import unittest
+from shared.kinddbsvc.queries import KIND_OPERATION, LINK_OPERATION, multiplexed_document, \
+    multiplexed_variables, split_multiplexed
+from shared.kinddbsvc.multiplexer import QueryMultiplexer
+
+
+def run(coroutine):
+    return asyncio.get_event_loop().run_until_complete(coroutine)
+
+
+class FakeSvc:
+
+    def __init__(self, delay=0.0):
+        self.tenantId = "tenant"
+        self.delay = delay
+        self.requests = []
+
+    async def _execute(self, document, variables, persisted=True):
+        self.requests.append((document, variables, persisted))
+        await asyncio.sleep(self.delay)
+        count = len([k for k in variables if k.startswith("kindName_")])
+        return {"data": {"m{}".format(i): {"name": variables["kindName_{}".format(i)]} for i in range(count)}}
+
+
+class TestSplitMultiplexed(unittest.TestCase):
+
+    def test_document_and_variables_are_aliased(self):
+        operations = (KIND_OPERATION, LINK_OPERATION)
+        document = multiplexed_document(operations)
+        self.assertIn("m0: kind(tenantId: $tenantId, id: $kindId_0, name: $kindName_0)", document.text)
+        self.assertIn("m1: link(tenantId: $tenantId, id: $id_1)", document.text)
+        self.assertEqual({"tenantId": "t", "kindId_0": None, "kindName_0": "A", "id_1": "l1"},
+                         multiplexed_variables("t", operations, [{"kindName": "A"}, {"id": "l1"}]))
+
+    def test_data_and_errors_go_to_their_operation(self):
+        operations = (KIND_OPERATION, KIND_OPERATION, LINK_OPERATION)
+        out = {
+            "data": {"m0": {"id": "k0"}, "m1": None, "m2": {"id": "l2"}},
+            "errors": [
+                {"message": "not found", "path": ["m1", "schema"]},
+                {"message": "rate limited"}
+            ]
+        }
+        results = split_multiplexed(operations, out)
+        self.assertEqual({"kind": {"id": "k0"}}, results[0]["data"])
+        self.assertEqual([{"message": "rate limited"}], results[0]["errors"])
+        self.assertEqual({"kind": None}, results[1]["data"])
+        self.assertEqual([{"message": "rate limited"}, {"message": "not found", "path": ["kind", "schema"]}],
+                         results[1]["errors"])
+        self.assertEqual({"link": {"id": "l2"}}, results[2]["data"])
+
+
+class TestQueryMultiplexer(unittest.TestCase):
+
+    def test_concurrent_operations_share_one_request(self):
+        async def scenario():
+            svc = FakeSvc()
+            multiplexer = QueryMultiplexer(svc, window=0.01, maxOperations=10)
+            results = await asyncio.gather(*[multiplexer.submit(KIND_OPERATION, {"kindName": n}) for n in "ABC"])
+            self.assertEqual(1, len(svc.requests))
+            self.assertFalse(svc.requests[0][2])
+            self.assertEqual(["A", "B", "C"], [r["data"]["kind"]["name"] for r in results])
+
+        run(scenario())
+
+    def test_flush_waits_for_batches_in_flight(self):
+        async def scenario():
+            svc = FakeSvc(delay=0.05)
+            multiplexer = QueryMultiplexer(svc, window=10, maxOperations=2)
+            futures = [multiplexer.submit(KIND_OPERATION, {"kindName": n}) for n in "ABC"]
+            await multiplexer.flush()
+            self.assertTrue(all(f.done() for f in futures))
+            self.assertEqual(2, len(svc.requests))
+            self.assertEqual(0, len(multiplexer.tasks))
+
+        run(scenario())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import asyncio
+import unittest
+from shared.kinddbsvc.nested import NestedInstanceResolver
+
+
+def run(coroutine):
+    return asyncio.get_event_loop().run_until_complete(coroutine)
+
+
+def ref(name, kindId, many=False):
+    return {"name": name, "type": "KIND", "typeKindId": kindId, "modifiers": ["LIST"] if many else []}
+
+
+def instance_set(kindId, fields, records):
+    schema = [{"name": "id", "type": "ID"}] + fields
+    return {"kindId": kindId, "kind": {"schema": schema}, "records": records}
+
+
+def row(id, *refs):
+    return [{"ID": id}] + list(refs)
+
+
+# Serves allInstances results for the kinds it knows and counts the fetches.
+class FakeKindDB:
+
+    def __init__(self, sets):
+        self.sets = sets
+        self.fetches = []
+
+    async def fetch(self, kindId):
+        self.fetches.append(kindId)
+        s = self.sets.get(kindId)
+        return {"allInstances": s} if s is not None else None
+
+
+class TestNestedInstanceResolver(unittest.TestCase):
+
+    def test_cycle_terminates_leaving_back_reference_as_id(self):
+        db = FakeKindDB({
+            "B": instance_set("B", [ref("a", "A")], [row("b1", {"KIND": "a1"})])
+        })
+        root = instance_set("A", [ref("b", "B")], [row("a1", {"KIND": "b1"})])
+
+        out = run(NestedInstanceResolver(db.fetch).resolve(root))
+
+        nested = out["records"][0][1]["KIND"]
+        self.assertEqual({"ID": "b1"}, nested[0])
+        self.assertEqual({"KIND": "a1"}, nested[1])
+        self.assertEqual(["B"], db.fetches)
+
+    def test_self_reference_is_left_as_id(self):
+        db = FakeKindDB({})
+        root = instance_set("A", [ref("parent", "A")], [row("a1", {"KIND": None}), row("a2", {"KIND": "a1"})])
+
+        out = run(NestedInstanceResolver(db.fetch).resolve(root))
+
+        self.assertEqual({"KIND": "a1"}, out["records"][1][1])
+        self.assertEqual([], db.fetches)
+
+    def test_shared_kind_is_fetched_once(self):
+        db = FakeKindDB({
+            "B": instance_set("B", [ref("d", "D")], [row("b1", {"KIND": "d1"})]),
+            "C": instance_set("C", [ref("d", "D", many=True)], [row("c1", {"l_KIND": ["d1", "d2"]})]),
+            "D": instance_set("D", [], [row("d1"), row("d2")])
+        })
+        root = instance_set("A", [ref("b", "B"), ref("c", "C")], [row("a1", {"KIND": "b1"}, {"KIND": "c1"})])
+
+        out = run(NestedInstanceResolver(db.fetch, concurrency=1).resolve(root))
+
+        record = out["records"][0]
+        self.assertEqual([{"ID": "d1"}], record[1]["KIND"][1]["KIND"])
+        self.assertEqual([[{"ID": "d1"}], [{"ID": "d2"}]], record[2]["KIND"][1]["l_KIND"])
+        self.assertEqual(["D"], [k for k in db.fetches if k == "D"])
+        self.assertEqual(3, len(db.fetches))
+
+    def test_expansion_stops_at_max_depth(self):
+        db = FakeKindDB({
+            "B": instance_set("B", [ref("c", "C")], [row("b1", {"KIND": "c1"})]),
+            "C": instance_set("C", [], [row("c1")])
+        })
+        root = instance_set("A", [ref("b", "B")], [row("a1", {"KIND": "b1"})])
+
+        out = run(NestedInstanceResolver(db.fetch, max_depth=1).resolve(root))
+
+        self.assertEqual({"KIND": "c1"}, out["records"][0][1]["KIND"][1])
+        self.assertEqual(["B"], db.fetches)
+
+    def test_missing_kind_clears_the_reference(self):
+        db = FakeKindDB({})
+        root = instance_set("A", [ref("b", "B")], [row("a1", {"KIND": "b1"})])
+
+        out = run(NestedInstanceResolver(db.fetch).resolve(root))
+
+        self.assertEqual({"KIND": None}, out["records"][0][1])
+
+
+if __name__ == '__main__':
+    unittest.main()
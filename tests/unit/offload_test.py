@@ -0,0 +1,63 @@
+import asyncio
+import threading
+import unittest
+from shared.graphql_server import offload
+
+
+def run(coroutine):
+    return asyncio.get_event_loop().run_until_complete(coroutine)
+
+
+@offload.offload(offload.THREAD)
+def resolve_thread(root, info, name):
+    return root, info, name, threading.current_thread() is threading.main_thread()
+
+
+@offload.offload(offload.THREAD)
+def resolve_error(root, info):
+    raise ValueError("boom")
+
+
+@offload.offload(offload.PROCESS)
+def resolve_square(root, info, n):
+    return root, info, n * n
+
+
+class TestOffload(unittest.TestCase):
+
+    def setUp(self):
+        self.saved = dict(offload.pools)
+        offload.pools[offload.THREAD] = offload.OffloadPool(offload.THREAD, 2)
+        offload.pools[offload.PROCESS] = offload.OffloadPool(offload.PROCESS, 1)
+
+    def tearDown(self):
+        offload.shutdown()
+        offload.pools.update(self.saved)
+
+    def test_thread_resolver_runs_off_the_loop_with_root_and_info(self):
+        result = run(resolve_thread("root", "info", name="x"))
+        self.assertEqual(("root", "info", "x", False), result)
+
+        stats = offload.stats()[offload.THREAD]
+        self.assertEqual(1, stats["submitted"])
+        self.assertEqual(1, stats["completed"])
+        self.assertEqual(0, stats["pending"])
+        self.assertEqual(2, stats["workers"])
+
+    def test_errors_are_raised_and_counted(self):
+        with self.assertRaises(ValueError):
+            run(resolve_error(None, None))
+        self.assertEqual(1, offload.stats()[offload.THREAD]["errors"])
+
+    def test_process_resolver_is_found_by_name_without_root_and_info(self):
+        self.assertIn(__name__ + ":resolve_square", offload._registry)
+        self.assertEqual((None, None, 9), run(resolve_square("root", "info", n=3)))
+        self.assertEqual(1, offload.stats()[offload.PROCESS]["completed"])
+
+    def test_unknown_pool_is_rejected(self):
+        with self.assertRaises(ValueError):
+            offload.offload("gpu")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import unittest
+from graphql import parse
+from shared.graphql_server.response_cache import ResponseCache, operation_root_fields
+
+
+class Clock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestOperationRootFields(unittest.TestCase):
+
+    def test_fields_of_root_fragments_are_included(self):
+        document = parse("""
+            query Q { info { id } ...More ... on Query { person(id: "1") { name } } }
+            fragment More on Query { kinds(ids: []) { id } ...More }
+        """)
+        self.assertEqual(("query", ("info", "kinds", "person")), operation_root_fields(document))
+
+    def test_operation_is_selected_by_name(self):
+        document = parse("query A { info { id } } mutation B { addPerson(input: {id: 1, name: \"x\"}) }")
+        self.assertEqual(("mutation", ("addPerson",)), operation_root_fields(document, "B"))
+        self.assertEqual((None, ()), operation_root_fields(document))
+
+    def test_unknown_fragment_makes_fields_unknown(self):
+        self.assertEqual(("query", None), operation_root_fields(parse("{ ...Missing }")))
+
+
+class TestResponseCache(unittest.TestCase):
+
+    def test_key_depends_on_tenant_variables_and_whitespace_insensitive_query(self):
+        cache = ResponseCache()
+        key = cache.key("{ person(id: $id) { name } }", {"id": "1", "x": 2}, None, tenant="t1")
+        self.assertEqual(key, cache.key("{ person(id: $id)\n  { name } }", {"x": 2, "id": "1"}, None, tenant="t1"))
+        self.assertNotEqual(key, cache.key("{ person(id: $id) { name } }", {"id": "1", "x": 2}, None, tenant="t2"))
+        self.assertNotEqual(key, cache.key("{ person(id: $id) { name } }", {"id": "2", "x": 2}, None, tenant="t1"))
+
+    def test_ttl_is_smallest_field_hint(self):
+        clock = Clock()
+        cache = ResponseCache(fieldTtls={"info": 3600, "person": 60}, clock=clock)
+        entry = cache.put("k", b"{}", ("info", "person"))
+        self.assertEqual(60, cache.max_age(entry))
+        clock.now = 59
+        self.assertIsNotNone(cache.get("k"))
+        clock.now = 60
+        self.assertIsNone(cache.get("k"))
+        self.assertEqual(0, cache.stats()["bytes"])
+
+    def test_unhinted_fields_are_not_cached_without_default_ttl(self):
+        cache = ResponseCache(fieldTtls={"info": 3600})
+        self.assertIsNone(cache.put("k", b"{}", ("info", "kinds")))
+        self.assertIsNone(cache.put("k", b"{}", None))
+        self.assertIsNotNone(ResponseCache(defaultTtl=5).put("k", b"{}", ("kinds",)))
+
+    def test_least_recently_used_entries_are_evicted_by_size(self):
+        cache = ResponseCache(maxBytes=10, defaultTtl=60)
+        cache.put("a", b"aaaa", ("info",))
+        cache.put("b", b"bbbb", ("info",))
+        cache.get("a")
+        cache.put("c", b"cccc", ("info",))
+        self.assertIsNone(cache.get("b"))
+        self.assertIsNotNone(cache.get("a"))
+        self.assertEqual(8, cache.stats()["bytes"])
+        self.assertEqual(1, cache.stats()["evictions"])
+        self.assertIsNone(cache.put("d", b"d" * 11, ("info",)))
+
+    def test_mutation_drops_only_declared_fields(self):
+        cache = ResponseCache(defaultTtl=60, invalidates={"addPerson": ["person"]})
+        cache.put("info", b"{}", ("info",))
+        cache.put("person", b"{}", ("person",))
+        cache.invalidate_mutation(("addPerson",))
+        self.assertIsNotNone(cache.get("info"))
+        self.assertIsNone(cache.get("person"))
+
+    def test_undeclared_mutation_drops_everything(self):
+        cache = ResponseCache(defaultTtl=60, invalidates={"addPerson": ["person"]})
+        cache.put("info", b"{}", ("info",))
+        cache.put("person", b"{}", ("person",))
+        cache.invalidate_mutation(("addPerson", "deletePerson"))
+        self.assertEqual(0, cache.stats()["entries"])
+        self.assertEqual(2, cache.stats()["invalidations"])
+
+
+if __name__ == '__main__':
+    unittest.main()
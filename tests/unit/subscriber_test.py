@@ -0,0 +1,169 @@
+import asyncio
+import unittest
+from collections import OrderedDict
+from shared.maana_amqp_pubsub.amqp_pubsub import AmqpPubSub
+from shared.maana_amqp_pubsub.configuration import AmqpConnectionConfig, QueueConfig
+from shared.maana_amqp_pubsub.subscriber import AMQPSubscriber, BatchAcker, RETRY_HEADER
+
+
+def run(coroutine):
+    return asyncio.get_event_loop().run_until_complete(coroutine)
+
+
+class FakeMessage:
+
+    def __init__(self, delivery_tag, body=b"{}", headers=None):
+        self.delivery_tag = delivery_tag
+        self.body = body
+        self.headers = headers
+        self.content_type = "application/json"
+        self.content_encoding = None
+        self.delivery_mode = 2
+        self.acks = []
+
+    def ack(self, multiple=False):
+        self.acks.append(multiple)
+
+    def nack(self, requeue=True):
+        pass
+
+
+class FakeExchange:
+
+    def __init__(self):
+        self.published = []
+
+    async def publish(self, message, routing_key):
+        self.published.append((routing_key, message))
+
+    async def bind(self, exchange, routing_key):
+        pass
+
+
+class FakeQueue(FakeExchange):
+
+    def __init__(self, name, arguments):
+        super().__init__()
+        self.name = name
+        self.arguments = arguments
+        self.callback = None
+
+    async def consume(self, callback):
+        self.callback = callback
+
+
+class FakeChannel:
+
+    def __init__(self):
+        self.default_exchange = FakeExchange()
+        self.queues = OrderedDict()
+
+    async def declare_exchange(self, **kwargs):
+        return FakeExchange()
+
+    async def declare_queue(self, name, arguments=None, **kwargs):
+        queue = self.queues[name] = FakeQueue(name, arguments)
+        return queue
+
+    async def close(self):
+        pass
+
+
+class TestBatchAcker(unittest.TestCase):
+
+    def test_acks_the_completed_prefix_at_once(self):
+        async def scenario():
+            acker = BatchAcker(batch_size=3, interval=10)
+            messages = [FakeMessage(tag) for tag in (1, 2, 3)]
+            for message in messages:
+                acker.track(message)
+            for message in messages:
+                acker.done(message)
+            self.assertEqual([[], [], [True]], [m.acks for m in messages])
+            self.assertEqual(1, acker.acks)
+            self.assertEqual(3, acker.acked_messages)
+            self.assertEqual(0, len(acker.pending))
+
+        run(scenario())
+
+    def test_slow_message_does_not_block_later_acks(self):
+        async def scenario():
+            acker = BatchAcker(batch_size=2, interval=10)
+            messages = [FakeMessage(tag) for tag in (1, 2, 3, 4)]
+            for message in messages:
+                acker.track(message)
+            acker.done(messages[1])
+            acker.done(messages[2])
+            # Message 1 is still in progress; 2 and 3 are acknowledged alone.
+            self.assertEqual([[], [False], [False], []], [m.acks for m in messages])
+
+            acker.done(messages[0])
+            acker.done(messages[3])
+            # One multiple ack on 4 covers 1; 2 and 3 are no longer outstanding.
+            self.assertEqual([[], [False], [False], [True]], [m.acks for m in messages])
+            self.assertEqual(4, acker.acked_messages)
+            self.assertEqual(0, len(acker.pending))
+
+        run(scenario())
+
+    def test_restarted_delivery_tags_reset_pending(self):
+        async def scenario():
+            acker = BatchAcker(batch_size=1, interval=10)
+            old = [FakeMessage(1), FakeMessage(2)]
+            for message in old:
+                acker.track(message)
+
+            # The channel was reopened: tags start again from 1.
+            new = FakeMessage(1)
+            acker.track(new)
+            acker.done(old[1])
+            self.assertEqual([], old[1].acks)
+            acker.done(new)
+            self.assertEqual([True], new.acks)
+            self.assertEqual(0, acker.completed)
+
+        run(scenario())
+
+
+class TestRetry(unittest.TestCase):
+
+    def test_failing_handler_is_retried_then_dead_lettered(self):
+        async def scenario():
+            pubsub = AmqpPubSub(AmqpConnectionConfig("localhost", 5672, "svc"))
+
+            def failing(message):
+                raise ValueError("boom")
+
+            pubsub.handlers["fileAdded"] = OrderedDict([(1, failing)])
+            config = QueueConfig("fileAdded", "svc", max_retries=2, ack_batch_size=1)
+            channel = FakeChannel()
+            subscriber = AMQPSubscriber(None)
+            queue = await subscriber.setup_channel(channel, config)
+            await subscriber.subscribe_to_channel(queue, config, lambda m: pubsub.on_message("fileAdded", m),
+                                                  channel)
+
+            retry = channel.queues["fileAdded.svc.Queue.Retry.1"]
+            self.assertEqual("fileAdded.svc.Queue", retry.arguments["x-dead-letter-routing-key"])
+            self.assertEqual(500, retry.arguments["x-message-ttl"])
+            self.assertIn("fileAdded.svc.Queue.DeadLetter", channel.queues)
+
+            # Every delivery fails; its copy expires back from the delay queue
+            # as a new delivery and the original is acknowledged at once.
+            message = FakeMessage(1)
+            routes = []
+            for tag in (1, 2, 3):
+                await queue.callback(message)
+                self.assertEqual([True], message.acks)
+                routing_key, copy = channel.default_exchange.published[-1]
+                routes.append(routing_key)
+                message = FakeMessage(tag + 1, copy.body, copy.headers)
+
+            self.assertEqual(["fileAdded.svc.Queue.Retry.1", "fileAdded.svc.Queue.Retry.2",
+                              "fileAdded.svc.Queue.DeadLetter"], routes)
+            self.assertEqual(3, channel.default_exchange.published[-1][1].headers[RETRY_HEADER])
+
+        run(scenario())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import asyncio
+import unittest
+from graphql.error import GraphQLError
+from shared.graphql_server.subscriptions import BoundedQueue, SubscriptionHub, DROP_OLDEST, DROP_NEWEST, DISCONNECT
+
+
+def run(coroutine):
+    return asyncio.get_event_loop().run_until_complete(coroutine)
+
+
+def drain(queue):
+    return [queue.queue.get_nowait() for _ in range(len(queue))]
+
+
+class FakePubSub:
+
+    def __init__(self):
+        self.handlers = {}
+        self.unsubscribed = []
+
+    async def subscribe(self, trigger, onMessage):
+        self.handlers[trigger] = onMessage
+        return trigger
+
+    async def unsubscribe(self, subId):
+        self.unsubscribed.append(subId)
+        del self.handlers[subId]
+
+
+class TestBoundedQueue(unittest.TestCase):
+
+    def test_drop_oldest_keeps_newest_items(self):
+        queue = BoundedQueue(2, DROP_OLDEST)
+        self.assertEqual([True, True, False], [queue.put(n) for n in (1, 2, 3)])
+        self.assertEqual([2, 3], drain(queue))
+        self.assertEqual(1, queue.dropped)
+
+    def test_drop_newest_keeps_queued_items(self):
+        queue = BoundedQueue(2, DROP_NEWEST)
+        self.assertEqual([True, True, False], [queue.put(n) for n in (1, 2, 3)])
+        self.assertEqual([1, 2], drain(queue))
+        self.assertFalse(queue.overflowed)
+
+    def test_disconnect_rejects_everything_after_overflow(self):
+        queue = BoundedQueue(1, DISCONNECT)
+        queue.put(1)
+        self.assertFalse(queue.put(2))
+        self.assertTrue(queue.overflowed)
+        drain(queue)
+        self.assertFalse(queue.put(3))
+        self.assertEqual(2, queue.dropped)
+
+    def test_unknown_policy_is_rejected(self):
+        with self.assertRaises(ValueError):
+            BoundedQueue(1, "block")
+
+
+class TestSubscriptionHub(unittest.TestCase):
+
+    def test_unknown_trigger_is_rejected(self):
+        hub = SubscriptionHub(FakePubSub, triggers=["known"])
+        with self.assertRaises(GraphQLError):
+            hub.check("other")
+        with self.assertRaises(GraphQLError):
+            SubscriptionHub(FakePubSub).check("known")
+
+    def test_listeners_share_one_consumer_and_slow_ones_drop_oldest(self):
+        pubsub = FakePubSub()
+        hub = SubscriptionHub(lambda: pubsub, queueSize=2, triggers=["t"])
+
+        async def main():
+            fast = hub.events("t")
+            slow = hub.events("t")
+            first = asyncio.ensure_future(fast.__anext__())
+            second = asyncio.ensure_future(slow.__anext__())
+            while "t" not in pubsub.handlers:
+                await asyncio.sleep(0)
+            self.assertEqual(1, hub.stats()["triggers"])
+
+            await pubsub.handlers["t"](b"1")
+            self.assertEqual(b"1", await first)
+            self.assertEqual(b"1", await second)
+            for message in (b"2", b"3", b"4"):
+                await pubsub.handlers["t"](message)
+                self.assertEqual(message, await fast.__anext__())
+
+            self.assertEqual(b"3", await slow.__anext__())
+            self.assertEqual(1, hub.stats()["dropped"])
+
+            await fast.aclose()
+            self.assertEqual([], pubsub.unsubscribed)
+            await slow.aclose()
+            self.assertEqual(["t"], pubsub.unsubscribed)
+            self.assertEqual(0, hub.stats()["listeners"])
+
+        run(main())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import asyncio
+import unittest
+from shared.kinddbsvc.write_buffer import WriteBehindBuffer
+
+
+def run(coroutine):
+    return asyncio.get_event_loop().run_until_complete(coroutine)
+
+
+def instance(instanceId, kindId="k1", fieldIds=("f1",)):
+    return {"kindId": kindId, "id": instanceId, "fieldIds": list(fieldIds), "fieldValues": [{"STRING": instanceId}]}
+
+
+class FakeSvc:
+
+    def __init__(self, failing=()):
+        self.failing = failing
+        self.instanceSets = []
+        self.links = []
+
+    async def addInstanceSet(self, addInstanceSetInput):
+        await asyncio.sleep(0)
+        if addInstanceSetInput["kindId"] in self.failing:
+            raise RuntimeError("KindDB is down")
+        self.instanceSets.append(addInstanceSetInput)
+        return {"addInstanceSet": addInstanceSetInput["ids"]}
+
+    async def addLinks(self, addLinkInputs):
+        self.links.append(addLinkInputs)
+        return {"addLinks": [l["id"] for l in addLinkInputs]}
+
+
+class TestWriteBehindBuffer(unittest.TestCase):
+
+    def test_writes_are_grouped_by_kind_and_layout(self):
+        async def scenario():
+            svc = FakeSvc()
+            buffer = WriteBehindBuffer(svc, window=0.01, maxItems=100)
+            results = await asyncio.gather(
+                buffer.addInstance(instance("a")),
+                buffer.addInstance(instance("b")),
+                buffer.addInstance(instance("c", kindId="k2")),
+                buffer.addLink({"id": "l1"}))
+            self.assertEqual([{"addInstance": "a"}, {"addInstance": "b"}, {"addInstance": "c"}, {"addLink": "l1"}],
+                             results)
+            self.assertEqual([["a", "b"], ["c"]], [s["ids"] for s in svc.instanceSets])
+            self.assertEqual(1, len(svc.links))
+            self.assertEqual(1, buffer.stats()["flushes"])
+
+        run(scenario())
+
+    def test_max_items_starts_a_flush_and_flush_waits_for_it(self):
+        async def scenario():
+            svc = FakeSvc()
+            buffer = WriteBehindBuffer(svc, window=10, maxItems=2)
+            futures = [buffer.addInstance(instance(i)) for i in "ab"]
+            # Let the flush started by maxItems take a and b before c arrives.
+            await asyncio.sleep(0)
+            futures.append(buffer.addInstance(instance("c")))
+            await buffer.flush()
+            self.assertTrue(all(f.done() for f in futures))
+            self.assertEqual([["a", "b"], ["c"]], [s["ids"] for s in svc.instanceSets])
+
+        run(scenario())
+
+    def test_errors_fail_only_their_callers(self):
+        async def scenario():
+            svc = FakeSvc(failing=("k2",))
+            buffer = WriteBehindBuffer(svc, window=0.01, maxItems=100)
+            results = await asyncio.gather(
+                buffer.addInstance(instance("a")),
+                buffer.addInstance(instance("b", kindId="k2")),
+                buffer.addInstance({"id": "missing kind"}),
+                return_exceptions=True)
+            self.assertEqual({"addInstance": "a"}, results[0])
+            self.assertIsInstance(results[1], RuntimeError)
+            self.assertIsInstance(results[2], ValueError)
+
+        run(scenario())
+
+    def test_closed_buffer_rejects_writes(self):
+        async def scenario():
+            buffer = WriteBehindBuffer(FakeSvc())
+            await buffer.close()
+            with self.assertRaises(RuntimeError):
+                buffer.addInstance(instance("a"))
+
+        run(scenario())
+
+
+if __name__ == '__main__':
+    unittest.main()